@@ -1,7 +1,27 @@
+from django import forms
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Exists, F, OuterRef, Q
 from django_filters.rest_framework import (
-    BooleanFilter, CharFilter, FilterSet, ModelMultipleChoiceFilter)
+    BooleanFilter, CharFilter, FilterSet, MultipleChoiceFilter, NumberFilter)
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.paginators import CustomPagination
+from recipes.models import Favorite, Recipe, RecipeTag, ShoppingCart
+
+
+class MultipleValueField(forms.MultipleChoiceField):
+    """Список значений без проверки по списку вариантов."""
+
+    def valid_value(self, value):
+        return True
+
+
+class MultipleValueFilter(MultipleChoiceFilter):
+    """Фильтр по повторяющемуся параметру (?tags=a&tags=b)."""
+
+    field_class = MultipleValueField
 
 
 class RecipeFilterSet(FilterSet):
@@ -10,39 +30,68 @@ class RecipeFilterSet(FilterSet):
         is_favorited
         is_in_shopping_cart
         tags
+        author
+        search (полнотекстовый поиск по названию и описанию)
     """
 
     is_favorited = BooleanFilter(
         field_name='is_favorited', method='filter_is_favorited')
     is_in_shopping_cart = BooleanFilter(
         field_name='is_in_shopping_cart', method='filter_is_in_shopping_cart')
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = MultipleValueFilter(field_name='tags', method='filter_tags')
+    author = NumberFilter(field_name='author_id')
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'is_in_shopping_cart', 'tags', 'author']
+        fields = [
+            'is_favorited', 'is_in_shopping_cart', 'tags', 'author', 'search']
+
+    # Связанные таблицы проверяются подзапросами EXISTS: рецепт не
+    # дублируется при совпадении нескольких тегов, а сочетание фильтров
+    # проверяется по индексам (tag, recipe) и (user, recipe).
+
+    def filter_tags(self, queryset, name, value):
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag__slug__in=value)))
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            queryset = queryset.filter(is_favorited__user=self.request.user)
+            queryset = queryset.filter(Exists(Favorite.objects.filter(
+                recipe=OuterRef('pk'), user=self.request.user)))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
-            queryset = queryset.filter(
-                in_shopping_cart__user=self.request.user)
+            queryset = queryset.filter(Exists(ShoppingCart.objects.filter(
+                recipe=OuterRef('pk'), user=self.request.user)))
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        """
+        В PostgreSQL - поиск по поисковому вектору (GIN-индекс,
+        русская конфигурация) с сортировкой по релевантности.
+        В остальных СУБД (SQLite в тестах) - поиск подстроки.
+        С пагинацией по ключу не сочетается: она задаёт свой порядок.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        if self.uses_cursor_pagination():
+            raise ValidationError({
+                'search': 'Поиск несовместим с пагинацией по ключу: '
+                          'результаты упорядочены по релевантности.'})
+        if connections[queryset.db].vendor != 'postgresql':
+            return queryset.filter(
+                Q(name__icontains=value) | Q(text__icontains=value))
+        query = SearchQuery(value, config='russian', search_type='websearch')
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query),
+        ).order_by('-rank', '-id')
 
-class IngredientsFilterSet(FilterSet):
-    """Фильтр для ингредиентов"""
-
-    name = CharFilter(field_name='name', lookup_expr='icontains')
-
-    class Meta:
-        model = Ingredient
-        fields = ['name']
+    def uses_cursor_pagination(self) -> bool:
+        view = self.request.parser_context.get('view')
+        paginator = getattr(view, 'paginator', None)
+        return isinstance(paginator, CursorPagination) or (
+            isinstance(paginator, CustomPagination)
+            and paginator.cursor_query_param in self.request.query_params)
@@ -0,0 +1,94 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+from core.cache import LRUCache, get_version
+
+
+class CatalogCacheMixin:
+    """
+    Кэширование ответов list/retrieve для редко меняющихся
+    справочников. Готовый JSON хранится в памяти процесса по ключу
+    (справочник, версия, путь с параметрами), ответ снабжается ETag
+    и Cache-Control, на совпавший If-None-Match отдаётся 304.
+    Версию справочника меняют сигналы при записи в его модель.
+    """
+
+    catalog_name = None
+    catalog_cache = LRUCache(
+        settings.CATALOG_CACHE_ITEMS, settings.CATALOG_CACHE_SIZE)
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+
+        key = (
+            self.catalog_name,
+            get_version(self.catalog_name),
+            request.get_full_path(),
+        )
+        etag = '"{}"'.format(hashlib.md5(repr(key).encode()).hexdigest())
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            content = self.catalog_cache.get(key)
+            if content is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = renderer.render(
+                    response.data,
+                    request.accepted_media_type,
+                    self.get_renderer_context(),
+                )
+                self.catalog_cache.set(key, content)
+            response = HttpResponse(content, content_type=renderer.media_type)
+        response['ETag'] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+        return response
+
+
+class SerializeTimingMixin:
+    """
+    list/retrieve с замером времени сериализации ответа для заголовка
+    Server-Timing (RequestTimingMiddleware). Без middleware данные
+    сериализатора берутся как обычно.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(self.serialize(serializer))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(self.serialize(serializer))
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        return Response(self.serialize(serializer))
+
+    def serialize(self, serializer):
+        timing = getattr(self.request, '_timing', None)
+        if timing is None:
+            return serializer.data
+        started = time.perf_counter()
+        try:
+            return serializer.data
+        finally:
+            timing.serialize_time += time.perf_counter() - started
@@ -1,14 +1,43 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CustomCursorPagination(CursorPagination):
+    """
+    Пагинация по ключу: следующая страница выбирается условием
+    по 'id' относительно последней записи, без OFFSET и COUNT(*).
+    Порядок берётся из Meta.ordering модели.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        return tuple(queryset.model._meta.ordering) or ('-pk',)
 
 
 class CustomPagination(PageNumberPagination):
     """
     Кастомный пагинатор, основывающийся на значении
-    параметра '?limit=' в запросе.
+    параметра '?limit=' в запросе (не больше MAX_PAGE_SIZE).
+    При наличии параметра '?cursor=' (в т.ч. пустого) переключается
+    на пагинацию по ключу.
     """
 
-    def get_page_size(self, request):
-        limit = request.query_params.get('limit')
-        if limit:
-            return int(limit)
-        return self.page_size
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    cursor_pagination_class = CustomCursorPagination
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
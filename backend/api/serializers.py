@@ -1,12 +1,17 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Manager, Prefetch, prefetch_related_objects
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.serializers import SerializerMethodField
 
-from core.utils import ingredients_tags_action
-from recipes.models import (
-    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag)
+from core.cache import get_version
+from core.images import schedule_image_variants
+from core.relations import related_ids
+from core.utils import ingredients_tags_action, recipe_fragment_key
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
 from users.serializers import UserCustomSerializer
 
 
@@ -29,6 +34,29 @@ class IngredientSeriaizer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
+class ImageVariantField(serializers.ImageField):
+    """
+    Адрес варианта изображения рецепта. Пока вариант не построен,
+    отдаётся адрес оригинала.
+    """
+
+    def __init__(self, variant: str, **kwargs):
+        self.variant = variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def get_file(self, recipe: Recipe):
+        return getattr(recipe, self.variant) or recipe.image
+
+    def get_url(self, recipe: Recipe):
+        """Относительный адрес файла (без хоста)."""
+        file = self.get_file(recipe)
+        return file.url if file else None
+
+    def to_representation(self, recipe: Recipe):
+        return super().to_representation(self.get_file(recipe))
+
+
 class RecipeIndredientSerializer(serializers.ModelSerializer):
     """
     Сериализатор для связывающей модели Рецепт-Ингредиент,
@@ -47,12 +75,10 @@ class RecipeIndredientSerializer(serializers.ModelSerializer):
 class RecipeIngredientAddSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели Рецепт-Ингредиент для добавления
-    записи при создании рецепта.
+    записи при создании рецепта. Существование ингредиентов
+    проверяется одним запросом в RecipeCreateSerializer.
     """
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient',
-        queryset=Ingredient.objects.all()
-    )
+    id = serializers.IntegerField(source='ingredient_id', min_value=1)
     amount = serializers.IntegerField(
         max_value=settings.MAX_VALUE, min_value=settings.MIN_VALUE)
 
@@ -67,9 +93,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
     """
 
     ingredients = RecipeIngredientAddSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
     image = Base64ImageField(required=False)
     cooking_time = serializers.IntegerField(
         max_value=settings.MAX_VALUE, min_value=settings.MIN_VALUE)
@@ -79,26 +103,57 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         fields = (
             'ingredients', 'tags', 'image', 'name', 'text', 'cooking_time')
 
+    @staticmethod
+    def check_ids(model, ids: list, name: str) -> None:
+        """Проверка списка id одним запросом IN."""
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(f'{name} не должны повторяться')
+        found = set(
+            model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                f'{name} не существуют: {missing}')
+
+    def validate_ingredients(self, ingredients: list) -> list:
+        self.check_ids(
+            Ingredient,
+            [item['ingredient_id'] for item in ingredients],
+            'Ингредиенты'
+        )
+        return ingredients
+
+    def validate_tags(self, tags: list) -> list:
+        self.check_ids(Tag, tags, 'Теги')
+        return tags
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
 
         ingredients_tags_action(recipe, ingredients, tags)
+        if recipe.image:
+            schedule_image_variants(recipe)
 
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         recipe.name = validated_data.get('name', recipe.name)
-        recipe.image = validated_data.get('image', recipe.image)
+        if validated_data.get('image'):
+            recipe.image = validated_data['image']
         recipe.text = validated_data.get('text', recipe.text)
         recipe.cooking_time = validated_data.get(
             'cooking_time', recipe.cooking_time)
-        tags = validated_data.get('tags', recipe.tags)
-        ingredients = validated_data.get('ingredients', recipe.ingredients)
+        tags = validated_data.get('tags')
+        ingredients = validated_data.get('ingredients')
 
         ingredients_tags_action(recipe, ingredients, tags)
         recipe.save()
+        if validated_data.get('image'):
+            schedule_image_variants(recipe)
 
         return recipe
 
@@ -108,9 +163,21 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return RecipeShowSerializer(instance, context=context).data
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Вывод списка рецептов через кэш фрагментов одним проходом."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, Manager) else data
+        return self.child.to_representation_many(list(recipes))
+
+
 class RecipeShowSerializer(serializers.ModelSerializer):
     """
     Сериализатор модели Рецептов для вывода данных.
+    Не зависящая от пользователя часть (теги, автор, ингредиенты,
+    текст, изображение) кэшируется по id рецепта; признаки
+    is_favorited, is_in_shopping_cart и author.is_subscribed
+    подставляются при каждом запросе.
     """
 
     ingredients = RecipeIndredientSerializer(
@@ -119,6 +186,11 @@ class RecipeShowSerializer(serializers.ModelSerializer):
     author = UserCustomSerializer()
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image = ImageVariantField('image')
+    image_thumbnail = ImageVariantField('image_thumbnail')
+    image_webp = ImageVariantField('image_webp')
+
+    image_fields = ('image', 'image_thumbnail', 'image_webp')
 
     class Meta:
         model = Recipe
@@ -131,22 +203,85 @@ class RecipeShowSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_thumbnail',
+            'image_webp',
             'text',
             'cooking_time'
         )
         read_only_fields = ('__all__',)
+        list_serializer_class = RecipeListSerializer
+
+    def to_representation(self, instance):
+        return self.to_representation_many([instance])[0]
+
+    def to_representation_many(self, recipes: list) -> list:
+        fragments = self.get_fragments(recipes)
+        return [
+            self.overlay(recipe, fragments[recipe.pk]) for recipe in recipes]
+
+    def get_fragments(self, recipes: list) -> dict:
+        """
+        Фрагменты рецептов из кэша. Недостающие строятся заново,
+        для них одним запросом подгружаются теги и ингредиенты.
+        Фрагмент устаревает также при смене версии справочников.
+        """
+        versions = (get_version('tags'), get_version('ingredients'))
+        keys = {
+            recipe.pk: recipe_fragment_key(recipe.pk) for recipe in recipes}
+        cached = cache.get_many(keys.values())
+        fragments = {}
+        for pk, key in keys.items():
+            entry = cached.get(key)
+            if entry is not None and entry['versions'] == versions:
+                fragments[pk] = entry['data']
+
+        missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if not missing:
+            return fragments
+        prefetch_related_objects(
+            missing,
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'with_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+        entries = {}
+        for recipe in missing:
+            data = super().to_representation(recipe)
+            for field in self.image_fields:
+                data[field] = self.fields[field].get_url(recipe)
+            data['is_favorited'] = data['is_in_shopping_cart'] = None
+            data['author']['is_subscribed'] = None
+            fragments[recipe.pk] = data
+            entries[keys[recipe.pk]] = {'versions': versions, 'data': data}
+        cache.set_many(entries, settings.RECIPE_CACHE_TIMEOUT)
+        return fragments
+
+    def overlay(self, recipe: Recipe, data: dict) -> dict:
+        """Подстановка в фрагмент данных текущего пользователя."""
+        request = self.context.get('request')
+        data['is_favorited'] = self.get_is_favorited(recipe)
+        data['is_in_shopping_cart'] = self.get_is_in_shopping_cart(recipe)
+        data['author']['is_subscribed'] = (
+            self.fields['author'].get_is_subscribed(recipe.author))
+        if request is not None:
+            for field in self.image_fields:
+                if data[field]:
+                    data[field] = request.build_absolute_uri(data[field])
+        return data
 
     def get_is_favorited(self, obj: Recipe) -> bool:
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return obj.is_favorited.filter(user=user).exists()
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
+        return obj.pk in related_ids(self.context.get('request'), 'favorites')
 
     def get_is_in_shopping_cart(self, obj: Recipe) -> bool:
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return obj.in_shopping_cart.filter(user=user).exists()
+        if hasattr(obj, 'in_cart'):
+            return obj.in_cart
+        return obj.pk in related_ids(
+            self.context.get('request'), 'shopping_cart')
 
 
 class RecipeShowShortSerializer(serializers.ModelSerializer):
@@ -155,9 +290,15 @@ class RecipeShowShortSerializer(serializers.ModelSerializer):
     (для сериализатора модели Подписок)
     """
 
+    image = ImageVariantField('image')
+    image_thumbnail = ImageVariantField('image_thumbnail')
+    image_webp = ImageVariantField('image_webp')
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumbnail', 'image_webp',
+            'cooking_time')
         read_only_fields = ('__all__',)
 
 
@@ -165,7 +306,6 @@ class SubscribeSerializer(serializers.ModelSerializer):
     """Сериализатор модели Подписок."""
 
     recipes = RecipeShowShortSerializer(many=True)
-    recipes_count = SerializerMethodField()
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -189,17 +329,13 @@ class SubscribeSerializer(serializers.ModelSerializer):
             'recipes': {'required': False},
         }
 
-    def get_recipes_count(self, obj: User) -> int:
-        """Поле количества рецептов автора."""
-        return obj.recipes.count()
-
     def get_is_subscribed(self, obj: User) -> bool:
         """Поле проверки подписки на пользователя/автора."""
 
-        user = self.context.get('request').user
-        if user.is_anonymous or (user == obj):
-            return False
-        return user.subscriber.filter(author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in related_ids(
+            self.context.get('request'), 'subscriptions')
 
     def validate(self, data):
         user = self.context['user']
@@ -214,55 +350,3 @@ class SubscribeSerializer(serializers.ModelSerializer):
                 'Невозможно подписаться на самого себя')
 
         return data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор добавление в избранное с кастомным выводом"""
-
-    class Meta:
-        model = Favorite
-        fields = ['user', 'recipe']
-
-    def validate(self, attrs):
-        request = self.context.get('request')
-        user = attrs['user']
-        recipe = attrs['recipe']
-
-        if request.method == 'POST':
-            if recipe.is_favorited.filter(user=user).exists():
-                raise serializers.ValidationError('Рецепт уже в избранном')
-        return super().validate(attrs)
-
-    def create(self, validated_data):
-        return Favorite.objects.create(**validated_data)
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return RecipeShowSerializer(instance.recipe, context=context).data
-
-
-class CartSerializer(serializers.ModelSerializer):
-    """Сериализатор добавление в избранное с кастомным выводом"""
-
-    class Meta:
-        model = ShoppingCart
-        fields = ['user', 'recipe']
-
-    def validate(self, attrs):
-        request = self.context.get('request')
-        user = attrs['user']
-        recipe = attrs['recipe']
-
-        if request.method == 'POST':
-            if recipe.in_shopping_cart.filter(user=user).exists():
-                raise serializers.ValidationError('Рецепт уже в КОРЗИНЕ')
-        return super().validate(attrs)
-
-    def create(self, validated_data):
-        return ShoppingCart.objects.create(**validated_data)
-
-    def to_representation(self, instance):
-        request = self.context.get('request')
-        context = {'request': request}
-        return RecipeShowShortSerializer(instance.recipe, context=context).data
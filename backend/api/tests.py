@@ -1,15 +1,62 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
 from http import HTTPStatus
+from io import StringIO
+from pathlib import PurePath
+from unittest import mock
 
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.test import TestCase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.models.signals import pre_delete, pre_save
+from django.http import HttpResponse
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APIClient
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
 
-from recipes.models import Ingredient, Tag, User
+from api.paginators import CustomPagination
+from api.serializers import RecipeShowSerializer
+from api.urls import ASYNC_VIEWS, router_v1
+from api.views import TagViewSet
+from core.async_views import offload, offload_patterns
+from core.cache import get_version
+from core.checks import check_shared_cache
+from core.counters import change_counter
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.db.router import ReplicaRouter, read_from_replicas
+from core.middleware import ReplicaMiddleware
+from core.utils import get_shopping_list, shopping_list_cache
+from recipes.management.commands.benchmark import SCENARIOS
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingCart,
+    ShoppingListItem, Subscribe, Tag, User)
+from users.authentication import token_cache_key
 
 
-class FoodgramAPITestCase(TestCase):
+class TemporaryMediaMixin:
+    """Удаление временного MEDIA_ROOT класса после его тестов."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FoodgramAPITestCase(TemporaryMediaMixin, TestCase):
     def setUp(self):
+        cache.clear()
         self.guest_client = APIClient()
         self.client = APIClient()
         self.user = User.objects.create_user(
@@ -52,3 +99,1038 @@ class FoodgramAPITestCase(TestCase):
             status.HTTP_201_CREATED,
             'Не удалось создать рецепт'
         )
+
+    def create_recipe(self):
+        recipe = Recipe.objects.create(
+            name='R', text='T', cooking_time=1, author=self.user)
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.ingr, amount=10)
+        RecipeTag.objects.create(recipe=recipe, tag=self.tag)
+        return recipe
+
+    def test_update_recipe_diff(self):
+        """Обновление меняет только отличающиеся связи."""
+        recipe = self.create_recipe()
+        row = recipe.with_ingredients.get()
+        other = Ingredient.objects.create(name='other', measurement_unit='g')
+        data = {
+            'ingredients': [
+                {'id': self.ingr.pk, 'amount': 20},
+                {'id': other.pk, 'amount': 5},
+            ],
+        }
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', data=data, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        row.refresh_from_db()
+        self.assertEqual(row.amount, 20)
+        self.assertEqual(recipe.with_ingredients.count(), 2)
+        self.assertEqual(
+            [tag['id'] for tag in response.data['tags']], [self.tag.pk])
+
+    def test_update_recipe_validation(self):
+        """Несуществующие и повторяющиеся id отклоняются."""
+        recipe = self.create_recipe()
+        url = f'/api/recipes/{recipe.pk}/'
+        for data in (
+            {'tags': [self.tag.pk, 999]},
+            {'tags': [self.tag.pk, self.tag.pk]},
+            {'ingredients': [{'id': 999, 'amount': 1}]},
+        ):
+            response = self.client.patch(url, data=data, format='json')
+            self.assertEqual(
+                response.status_code, HTTPStatus.BAD_REQUEST, data)
+        self.assertEqual(recipe.with_tags.count(), 1)
+
+    def test_shopping_list_totals(self):
+        """Итоги списка покупок меняются вместе с корзиной и рецептом."""
+        recipe = self.create_recipe()
+        other = Ingredient.objects.create(name='other', measurement_unit='g')
+        second = self.create_recipe()
+
+        def totals():
+            return {
+                item['name']: item['total']
+                for item in get_shopping_list(self.user)
+            }
+
+        self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.client.post(f'/api/recipes/{second.pk}/shopping_cart/')
+        self.assertEqual(totals(), {'test': 20})
+        with CaptureQueriesContext(connection) as context:
+            self.client.patch(f'/api/recipes/{recipe.pk}/', data={
+                'ingredients': [{'id': other.pk, 'amount': 5}],
+            }, format='json')
+        self.assertEqual(totals(), {'test': 10, 'other': 5})
+        table = ShoppingListItem._meta.db_table
+        self.assertEqual(len([
+            query for query in context.captured_queries
+            if query['sql'].startswith(f'INSERT INTO "{table}"')
+        ]), 1)
+        self.client.delete(f'/api/recipes/{second.pk}/shopping_cart/')
+        self.assertEqual(totals(), {'other': 5})
+        recipe.delete()
+        self.assertEqual(totals(), {})
+        out = StringIO()
+        call_command('rebuild_shopping_lists', dry_run=True, stdout=out)
+        self.assertIn('неверными итогами 0', out.getvalue())
+
+    @override_settings(IMAGE_WORKERS=0)
+    def test_image_variants(self):
+        """Варианты изображения строятся после фиксации транзакции."""
+        data = {
+            'name': 'TEST2',
+            'text': 'TEST2',
+            'cooking_time': 5,
+            'image': settings.TEST_IMAGE,
+            'ingredients': [{'id': self.ingr.pk, 'amount': 150}],
+            'tags': [self.tag.pk],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.data['image_thumbnail'],
+                         response.data['image'])
+        url = f'/api/recipes/{response.data["id"]}/'
+        response = self.client.get(url)
+        self.assertTrue(response.data['image_thumbnail'].endswith('.jpg'))
+        self.assertTrue(response.data['image_webp'].endswith('.webp'))
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        old_variants = [
+            os.path.join(settings.MEDIA_ROOT, field.name)
+            for field in (recipe.image_thumbnail, recipe.image_webp)
+        ]
+        for path in old_variants:
+            self.assertTrue(os.path.isfile(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                url, {'image': settings.TEST_IMAGE}, format='json')
+        recipe = Recipe.objects.get(pk=response.data['id'])
+        self.assertEqual(
+            PurePath(recipe.image_thumbnail.name).stem,
+            PurePath(recipe.image.name).stem)
+        for path in old_variants:
+            self.assertFalse(os.path.exists(path))
+        for field in (recipe.image_thumbnail, recipe.image_webp):
+            self.assertTrue(os.path.isfile(
+                os.path.join(settings.MEDIA_ROOT, field.name)))
+        self.assertFalse(response.data['image_thumbnail'].endswith(
+            recipe.image_thumbnail.url))
+
+
+class RecipeQueryCountTestCase(TestCase):
+    """
+    Проверка количества запросов к БД на ендпойнтах рецептов:
+    оно не должно зависеть от количества рецептов на странице.
+    """
+
+    RECIPES_COUNT = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader',
+            password='QAZwsx!1',
+            email='reader@test.loc',
+            first_name='Reader',
+            last_name='Readerov',
+        )
+        tags = [
+            Tag.objects.create(name=f'Tag{i}', color='#000000', slug=f't{i}')
+            for i in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'ingr{i}', measurement_unit='g')
+            for i in range(5)
+        ]
+        for i in range(cls.RECIPES_COUNT):
+            author = User.objects.create_user(
+                username=f'author{i}',
+                password='QAZwsx!1',
+                email=f'author{i}@test.loc',
+                first_name='Author',
+                last_name='Authorov',
+            )
+            recipe = Recipe.objects.create(
+                name=f'Recipe{i}', text='text', cooking_time=5, author=author)
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag=tag) for tag in tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingr, amount=10)
+                for ingr in ingredients)
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+                Subscribe.objects.create(user=cls.user, author=author)
+        cls.recipe = recipe
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_guest(self):
+        """Список рецептов для гостя: count, рецепты, авторы, теги,
+        ингредиенты."""
+        with self.assertNumQueries(5):
+            response = self.guest_client.get(
+                f'/api/recipes/?limit={self.RECIPES_COUNT}')
+        self.assertEqual(len(response.data['results']), self.RECIPES_COUNT)
+
+    def test_list_authorized(self):
+        """Флаги пользователя не добавляют запросов на каждый рецепт."""
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                f'/api/recipes/?limit={self.RECIPES_COUNT}')
+        results = response.data['results']
+        self.assertEqual(len(results), self.RECIPES_COUNT)
+        favorited = [r['is_favorited'] for r in results]
+        self.assertEqual(favorited.count(True), self.RECIPES_COUNT // 2)
+        for recipe in results:
+            self.assertEqual(
+                recipe['is_favorited'], recipe['is_in_shopping_cart'])
+            self.assertEqual(
+                recipe['is_favorited'], recipe['author']['is_subscribed'])
+
+    def test_list_cached(self):
+        """
+        Повторный вывод берёт фрагменты из кэша: теги и ингредиенты
+        не запрашиваются, флаги пользователя остаются актуальными.
+        """
+        url = f'/api/recipes/?limit={self.RECIPES_COUNT}'
+        self.client.get(url)
+        Favorite.objects.filter(user=self.user).delete()
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        results = response.data['results']
+        self.assertFalse(any(r['is_favorited'] for r in results))
+        self.assertEqual(
+            sum(r['is_in_shopping_cart'] for r in results),
+            self.RECIPES_COUNT // 2)
+
+        self.recipe.name = 'Renamed'
+        self.recipe.save()
+        response = self.client.get(url)
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed')
+
+    def test_detail(self):
+        """Детальная страница рецепта."""
+        url = f'/api/recipes/{self.recipe.pk}/'
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+        self.assertEqual(len(response.data['ingredients']), 5)
+        self.assertEqual(len(response.data['tags']), 3)
+
+    def test_cursor_pagination(self):
+        """Пагинация по ключу обходит все рецепты без COUNT(*)."""
+        url = '/api/recipes/?cursor=&limit=4'
+        ids = []
+        while url:
+            with self.assertNumQueries(4):
+                response = self.guest_client.get(url)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, list(
+            Recipe.objects.order_by('-id').values_list('id', flat=True)))
+
+    @mock.patch.object(CustomPagination, 'max_page_size', 3)
+    def test_page_size_limit(self):
+        """Размер страницы ограничен, некорректный limit игнорируется."""
+        response = self.guest_client.get('/api/recipes/?limit=100000')
+        self.assertEqual(len(response.data['results']), 3)
+        response = self.guest_client.get('/api/recipes/?limit=abc')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(
+            len(response.data['results']),
+            settings.REST_FRAMEWORK['PAGE_SIZE'])
+
+    def test_subscriptions(self):
+        """
+        Подписки: рецепты ограничены recipes_limit и подгружаются
+        одним запросом на страницу.
+        """
+        authored = Recipe.objects.filter(author__subscribed__user=self.user)
+        for recipe in authored:
+            Recipe.objects.create(
+                name='Extra', text='text', cooking_time=5,
+                author=recipe.author)
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/users/subscriptions/?limit=10&recipes_limit=1')
+        results = response.data['results']
+        self.assertEqual(len(results), self.RECIPES_COUNT // 2)
+        for author in results:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(author['recipes_count'], 2)
+            self.assertEqual(len(author['recipes']), 1)
+            self.assertEqual(author['recipes'][0]['name'], 'Extra')
+
+    def test_users_list(self):
+        """
+        is_subscribed для списка пользователей берётся из множества
+        подписок, загруженного один раз за запрос.
+        """
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/?limit=100')
+        results = response.data['results']
+        self.assertEqual(len(results), self.RECIPES_COUNT + 1)
+        self.assertEqual(
+            sum(user['is_subscribed'] for user in results),
+            self.RECIPES_COUNT // 2)
+        recipes = list(Recipe.objects.all())
+        serializer = RecipeShowSerializer(
+            context={'request': response.wsgi_request})
+        with self.assertNumQueries(2):
+            flags = [
+                (serializer.get_is_favorited(recipe),
+                 serializer.get_is_in_shopping_cart(recipe))
+                for recipe in recipes
+            ]
+        self.assertEqual(
+            flags.count((True, True)), self.RECIPES_COUNT // 2)
+
+    def test_subscribe(self):
+        """Ответ на подписку строится тем же запросом с recipes_limit."""
+        author = Recipe.objects.exclude(
+            author__subscribed__user=self.user).first().author
+        response = self.client.post(
+            f'/api/users/{author.pk}/subscribe/?recipes_limit=0')
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        self.assertTrue(response.data['is_subscribed'])
+        self.assertEqual(response.data['recipes_count'], 1)
+        self.assertEqual(response.data['recipes'], [])
+
+    def test_filters(self):
+        """Рецепт с несколькими тегами не дублируется, фильтры
+        сочетаются без лишних запросов."""
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                f'/api/recipes/?limit={self.RECIPES_COUNT}'
+                f'&tags=t0&tags=t1&tags=t2&is_favorited=1'
+                f'&is_in_shopping_cart=1')
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(response.data['count'], self.RECIPES_COUNT // 2)
+        self.assertEqual(len(set(ids)), len(ids))
+        response = self.client.get(
+            f'/api/recipes/?author={self.recipe.author_id}&tags=t0')
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_feed(self):
+        """Лента подписок: рецепты подписок новые первыми, подписка
+        и отписка сразу меняют ленту."""
+        subscribed = list(
+            Recipe.objects.filter(author__subscribed__user=self.user)
+            .values_list('pk', flat=True))
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/recipes/feed/?limit=3')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            subscribed[:3])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            subscribed[3:])
+        author = User.objects.get(username='author0')
+        self.client.post(f'/api/users/{author.pk}/subscribe/')
+        new = Recipe.objects.create(
+            name='New', text='text', cooking_time=5, author=author)
+        response = self.client.get('/api/recipes/feed/?limit=10')
+        ids = [recipe['id'] for recipe in response.data['results']]
+        self.assertEqual(ids[0], new.pk)
+        self.assertEqual(len(ids), len(subscribed) + 2)
+        self.client.delete(f'/api/users/{author.pk}/subscribe/')
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            subscribed)
+        self.assertEqual(
+            self.guest_client.get('/api/recipes/feed/').status_code,
+            HTTPStatus.UNAUTHORIZED)
+
+    def test_search(self):
+        """Поиск рецептов сочетается с остальными фильтрами."""
+        Recipe.objects.filter(pk=self.recipe.pk).update(text='Борщ с мясом')
+        response = self.client.get('/api/recipes/?search=Борщ')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipe.pk])
+        response = self.client.get(
+            '/api/recipes/?search=Борщ&is_favorited=1&tags=t0')
+        self.assertEqual(response.data['count'], 1)
+        response = self.client.get('/api/recipes/?search=Recipe1')
+        self.assertEqual(response.data['count'], 1)
+        for url in ('/api/recipes/?search=Борщ&cursor=',
+                    '/api/recipes/feed/?search=Борщ'):
+            response = self.client.get(url)
+            self.assertEqual(
+                response.status_code, HTTPStatus.BAD_REQUEST, url)
+
+    def test_search_vector_not_loaded(self):
+        """Поисковый вектор не читается при выводе рецептов."""
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/',
+                    '/api/users/subscriptions/'):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            self.assertFalse(
+                any('search_vector' in query['sql']
+                    for query in queries.captured_queries), url)
+
+    def test_shopping_list(self):
+        """Список покупок суммируется одним запросом."""
+        with self.assertNumQueries(1):
+            shopping_list = list(get_shopping_list(self.user))
+        self.assertEqual(
+            shopping_list,
+            [
+                {'name': f'ingr{i}', 'measurement_unit': 'g', 'total': 50}
+                for i in range(5)
+            ]
+        )
+
+    def test_download_shopping_cart(self):
+        """Выгрузка списка покупок в pdf."""
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+
+    def test_download_shopping_cart_cached(self):
+        """
+        Повторная выгрузка берётся из кэша до изменения корзины.
+        """
+        shopping_list_cache.clear()
+        url = '/api/recipes/download_shopping_cart/'
+        first = b''.join(self.client.get(url).streaming_content)
+        with self.assertNumQueries(1):
+            second = b''.join(self.client.get(url).streaming_content)
+        self.assertEqual(first, second)
+        self.assertEqual(shopping_list_cache.hits, 1)
+
+        ShoppingCart.objects.filter(user=self.user).first().delete()
+        third = b''.join(self.client.get(url).streaming_content)
+        self.assertNotEqual(first, third)
+        self.assertEqual(shopping_list_cache.misses, 2)
+
+
+class IngredientSearchTestCase(TestCase):
+    """Поиск ингредиентов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('морская соль', 'Соль', 'солод', 'фасоль', 'ёжевика'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_before_substring(self):
+        self.assertEqual(
+            self.search('сол'), ['солод', 'Соль', 'морская соль', 'фасоль'])
+        self.assertEqual(self.search('ЕЖ'), ['ёжевика'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_limit(self):
+        self.assertEqual(self.search('сол'), ['солод', 'Соль'])
+
+    def test_no_queries_and_refresh(self):
+        self.search('соль')
+        with self.assertNumQueries(0):
+            self.search('соль')
+        Ingredient.objects.create(name='соль крупная', measurement_unit='г')
+        self.assertIn('соль крупная', self.search('соль'))
+
+
+class ImportCommandTestCase(TestCase):
+    """Загрузка ингредиентов командой import."""
+
+    def call_import(self, data, suffix, *args):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix=suffix, encoding='utf-8') as file:
+            file.write(data)
+            file.flush()
+            call_command('import', file.name, *args, stdout=StringIO())
+
+    def test_json_rerun(self):
+        data = json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'щепотка'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+        ], ensure_ascii=False)
+        self.call_import(data, '.json', '--batch-size', '2')
+        self.call_import(data, '.json')
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_csv_dry_run(self):
+        data = 'соль,г\nперец,г\n'
+        self.call_import(data, '.csv', '--dry-run')
+        self.assertFalse(Ingredient.objects.exists())
+        self.call_import(data, '.csv')
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_invalid_rows_reported(self):
+        """Строки длиннее полей модели пропускаются с указанием причины."""
+        data = f'соль,г\n{"х" * 201},г\nперец,{"г" * 16}\n,г\n'
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.csv', encoding='utf-8') as file:
+            file.write(data)
+            file.flush()
+            out = StringIO()
+            call_command('import', file.name, '--dry-run', stdout=out)
+        output = out.getvalue()
+        for row in ('Строка 2: name', 'Строка 3: measurement_unit',
+                    'Строка 4: name', 'пропущено некорректных: 3'):
+            self.assertIn(row, output)
+
+
+class CatalogCacheTestCase(TestCase):
+    """HTTP-кэширование справочника тегов."""
+
+    url = '/api/tags/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Tag.objects.create(name='Завтрак', color='#000000', slug='breakfast')
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('max-age', response['Cache-Control'])
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+            not_modified = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(not_modified.status_code, HTTPStatus.NOT_MODIFIED)
+
+        Tag.objects.create(name='Обед', color='#ffffff', slug='lunch')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(len(response.json()), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_version_bumped_on_commit(self):
+        """Версия меняется ещё раз после фиксации транзакции."""
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', color='#ffffff', slug='lunch')
+            version = get_version('tags')
+        self.assertNotEqual(get_version('tags'), version)
+
+    def test_shared_cache_required(self):
+        """Несколько процессов с кэшем в памяти не запускаются."""
+        for args in ('--workers 2', '-w 3', '--workers=2'):
+            with mock.patch.dict(os.environ, GUNICORN_CMD_ARGS=args):
+                with self.assertRaises(ImproperlyConfigured):
+                    check_shared_cache()
+        with mock.patch.dict(os.environ, GUNICORN_CMD_ARGS='--workers 1'):
+            check_shared_cache()
+
+
+class CountersTestCase(TestCase):
+    """Денормализованные счётчики и их пересчёт."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='counter', password='QAZwsx!1', email='c@test.loc',
+            first_name='Counter', last_name='Counterov')
+        self.author = User.objects.create_user(
+            username='author', password='QAZwsx!1', email='a@test.loc',
+            first_name='Author', last_name='Authorov')
+        self.recipe = Recipe.objects.create(
+            name='Recipe', text='text', cooking_time=5, author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertCounters(self, favorites, cart, recipes, followers):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.cart_count,
+             self.author.recipes_count, self.author.followers_count),
+            (favorites, cart, recipes, followers)
+        )
+
+    def test_counters(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.post(url + 'favorite/')
+        self.client.post(url + 'shopping_cart/')
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertCounters(1, 1, 1, 1)
+        self.client.delete(url + 'favorite/')
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertCounters(0, 1, 1, 0)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_toggles(self):
+        """Повторы не создают дублей, а сигналы обновляют счётчики."""
+        for endpoint in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.recipe.pk}/{endpoint}/'
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.CREATED)
+            self.assertEqual(
+                set(response.data), {
+                    'id', 'name', 'image', 'image_thumbnail',
+                    'image_webp', 'cooking_time'})
+            response = self.client.post(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertCounters(1, 1, 1, 0)
+        self.assertFalse(get_shopping_list(self.user))
+        for endpoint in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.recipe.pk}/{endpoint}/'
+            response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+            response = self.client.delete(url)
+            self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+            response = self.client.post(f'/api/recipes/0/{endpoint}/')
+            self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+        self.assertCounters(0, 0, 1, 0)
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_pre_delete_sees_row(self):
+        """pre_delete отправляется, пока запись ещё в БД."""
+        seen = []
+
+        def before_delete(sender, instance, **kwargs):
+            seen.append(sender.objects.filter(pk=instance.pk).exists())
+
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.client.post(url)
+        pre_delete.connect(before_delete, sender=Favorite)
+        try:
+            self.client.delete(url)
+        finally:
+            pre_delete.disconnect(before_delete, sender=Favorite)
+        self.assertEqual(seen, [True])
+        self.assertFalse(Favorite.objects.exists())
+
+    def test_counters_survive_save(self):
+        """Полное сохранение не затирает счётчики, изменённые в БД."""
+        def concurrent_favorite(sender, instance, **kwargs):
+            change_counter(
+                Recipe.objects.filter(pk=instance.pk), 'favorites_count', 1)
+            change_counter(
+                User.objects.filter(pk=instance.author_id),
+                'followers_count', 1)
+
+        self.client.force_authenticate(self.author)
+        pre_save.connect(concurrent_favorite, sender=Recipe)
+        try:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.pk}/', {'name': 'New'},
+                format='json')
+        finally:
+            pre_save.disconnect(concurrent_favorite, sender=Recipe)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.author.first_name = 'Renamed'
+        self.author.save()
+        self.assertCounters(1, 0, 1, 1)
+        self.assertEqual(self.recipe.name, 'New')
+
+    def test_recount(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        Recipe.objects.update(favorites_count=7, cart_count=3)
+        User.objects.update(recipes_count=0)
+        call_command('recount', stdout=StringIO())
+        self.assertCounters(1, 0, 1, 0)
+
+
+class AdminTestCase(TestCase):
+    """Страницы админки рецептов не зависят по запросам от объёма данных."""
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', password='QAZwsx!1', email='admin@test.loc',
+            first_name='Admin', last_name='Adminov')
+        self.client.force_login(self.admin)
+        self.tag = Tag.objects.create(name='Тег', color='#000000', slug='t')
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+
+    def add_recipes(self, count):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                name=f'Recipe{i}', text='text', cooking_time=5,
+                author=self.admin)
+            RecipeTag.objects.create(recipe=recipe, tag=self.tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredient, amount=1)
+            Favorite.objects.create(user=self.admin, recipe=recipe)
+        return recipe
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context)
+
+    def test_changelists(self):
+        urls = [
+            '/admin/recipes/recipe/',
+            '/admin/recipes/favorite/',
+            '/admin/recipes/recipeingredient/',
+            '/admin/recipes/recipetag/',
+        ]
+        self.add_recipes(2)
+        before = [self.count_queries(url) for url in urls]
+        self.add_recipes(5)
+        self.assertEqual([self.count_queries(url) for url in urls], before)
+
+    def test_change_page(self):
+        recipe = self.add_recipes(1)
+        for i in range(20):
+            Ingredient.objects.create(name=f'ingr{i}', measurement_unit='г')
+        response = self.client.get(
+            f'/admin/recipes/recipe/{recipe.pk}/change/')
+        self.assertNotContains(response, 'ingr19')
+
+
+class TokenCacheTestCase(TestCase):
+    """Токен и пользователь берутся из кеша до выхода или смены пароля."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', password='QAZwsx!1', email='user@test.loc',
+            first_name='User', last_name='Userov')
+        self.client = APIClient()
+        self.token = self.client.post(
+            '/api/auth/token/login/',
+            {'email': 'user@test.loc', 'password': 'QAZwsx!1'},
+            format='json').data['auth_token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_cached(self):
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code, HTTPStatus.OK)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.json()['email'], 'user@test.loc')
+
+    def test_logout(self):
+        self.client.get('/api/users/me/')
+        self.client.post('/api/auth/token/logout/')
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code,
+            HTTPStatus.UNAUTHORIZED)
+
+    def test_deactivation(self):
+        self.client.get('/api/users/me/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(
+            self.client.get('/api/users/me/').status_code,
+            HTTPStatus.UNAUTHORIZED)
+
+    def test_set_password_keeps_counters(self):
+        """
+        Пароль и счётчики не кэшируются, поэтому сохранение
+        закэшированного пользователя не возвращает их прежние значения.
+        """
+        self.client.get('/api/users/me/')
+        snapshot = cache.get(token_cache_key(self.token))
+        self.assertNotIn(self.user.password, snapshot[1])
+        User.objects.filter(pk=self.user.pk).update(
+            recipes_count=1, followers_count=1, shopping_cart_version=3)
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': 'QAZwsx!1', 'new_password': 'WSXedc@2'},
+            format='json')
+        self.assertEqual(response.status_code, HTTPStatus.NO_CONTENT)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('WSXedc@2'))
+        self.assertEqual(
+            (self.user.recipes_count, self.user.followers_count,
+             self.user.shopping_cart_version), (1, 1, 3))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BenchmarkCommandTestCase(TemporaryMediaMixin, TestCase):
+    """Генерация данных воспроизводима, замер проходит без ошибок."""
+
+    def test_generate_and_benchmark(self):
+        call_command('generate_data', seed=1, stdout=StringIO())
+        self.assertEqual(
+            User.objects.filter(username__startswith='gen').count(), 100)
+        self.assertEqual(Recipe.objects.count(), 1000)
+        recipe = Recipe.objects.order_by('pk').first()
+        self.assertEqual(
+            recipe.favorites_count,
+            Favorite.objects.filter(recipe=recipe).count())
+        recipes = list(Recipe.objects.values_list('name', 'author__username'))
+        media = sorted(os.listdir(settings.MEDIA_ROOT))
+        with self.assertRaises(CommandError):
+            call_command('generate_data', stdout=StringIO())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command(
+                'benchmark', requests=2, warmup=0, output=output.name,
+                stdout=StringIO())
+            report = json.load(output)
+        self.assertEqual(
+            [name for name, result in report['endpoints'].items()
+             if result['errors']], [])
+        self.assertEqual(
+            list(report['endpoints']),
+            [scenario.name for scenario in SCENARIOS])
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', 'author__username')),
+            recipes)
+        self.assertEqual(sorted(os.listdir(settings.MEDIA_ROOT)), media)
+
+
+class RequestTimingTestCase(TestCase):
+    """Заголовок Server-Timing и лог медленных запросов."""
+
+    def setUp(self):
+        self.tag = Tag.objects.create(name='Тег', color='#000000', slug='t')
+        author = User.objects.create_user(
+            username='author', email='author@test.loc', password='QAZwsx!1',
+            first_name='Author', last_name='Authorov')
+        for i in range(5):
+            recipe = Recipe.objects.create(
+                name=f'Recipe{i}', text='text', cooking_time=5,
+                author=author)
+            RecipeTag.objects.create(recipe=recipe, tag=self.tag)
+
+    def test_disabled(self):
+        response = APIClient().get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(REQUEST_TIMING=True, SLOW_REQUEST_MS=0)
+    def test_server_timing_and_slow_log(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            response = APIClient().get('/api/recipes/?tags=t')
+        timing = response['Server-Timing']
+        for metric in ('total', 'db', 'view', 'serialize', 'render'):
+            self.assertIn(f'{metric};dur=', timing)
+        serialize = float(timing.split('serialize;dur=')[1].split(',')[0])
+        self.assertGreater(serialize, 0)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/api/recipes/?tags=t')
+        self.assertEqual(
+            record['queries'], sum(q['count'] for q in record['top_queries']))
+        self.assertIn(f'desc="{record["queries"]} queries"', timing)
+
+
+class AsyncViewsTestCase(TestCase):
+    """View в режиме ASGI выполняются в пуле потоков."""
+
+    def test_offload(self):
+        view = offload(TagViewSet.as_view({'get': 'list'}))
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+        self.assertTrue(view.csrf_exempt)
+        response = async_to_sync(view)(APIRequestFactory().get('/api/tags/'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_offload_patterns(self):
+        patterns = offload_patterns(router_v1.urls, ASYNC_VIEWS)
+        offloaded = {
+            pattern.name for pattern in patterns
+            if asyncio.iscoroutinefunction(pattern.callback)
+        }
+        self.assertEqual(offloaded, set(ASYNC_VIEWS))
+
+
+class ConnectionPoolTestCase(TestCase):
+    """Пул переиспользует, проверяет и ограничивает соединения."""
+
+    def test_reuse_and_limit(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        connection = pool.acquire(lambda: sqlite3.connect(':memory:'))
+        with self.assertRaises(PoolTimeout):
+            pool.acquire(lambda: sqlite3.connect(':memory:'))
+        pool.release(connection)
+        self.assertIs(pool.acquire(mock.Mock()), connection)
+        stats = pool.stats()
+        self.assertEqual(
+            (stats['created'], stats['reused'], stats['timeouts']), (1, 1, 1))
+
+    def test_health_check(self):
+        pool = ConnectionPool(
+            size=2, check_interval=0,
+            check=lambda connection: connection.execute('SELECT 1'))
+        connection = pool.acquire(lambda: sqlite3.connect(':memory:'))
+        pool.release(connection)
+        connection.close()
+        fresh = pool.acquire(lambda: sqlite3.connect(':memory:'))
+        self.assertIsNot(fresh, connection)
+        stats = pool.stats()
+        self.assertEqual((stats['failed_checks'], stats['closed']), (1, 1))
+        self.assertEqual(stats['open'], 1)
+
+    def test_diagnostics_staff_only(self):
+        user = User.objects.create_user(
+            username='user', password='QAZwsx!1', email='user@test.loc',
+            first_name='User', last_name='Userov')
+        client = APIClient()
+        client.force_authenticate(user)
+        url = '/api/diagnostics/db-pool/'
+        self.assertEqual(client.get(url).status_code, HTTPStatus.FORBIDDEN)
+        user.is_staff = True
+        self.assertEqual(client.get(url).status_code, HTTPStatus.OK)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1', 'replica_2'])
+class ReplicaRouterTestCase(TestCase):
+    """Чтение с реплик и закрепление за основной БД после записи."""
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.middleware = ReplicaMiddleware(self.get_response)
+        self.factory = APIRequestFactory()
+        self.status = HTTPStatus.OK
+
+    def get_response(self, request):
+        self.db = self.router.db_for_read(Recipe)
+        return HttpResponse(status=self.status)
+
+    def request(self, method, **headers):
+        request = getattr(self.factory, method)('/api/recipes/', **headers)
+        self.middleware(request)
+        return self.db
+
+    def test_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'recipes'))
+
+    def test_reads_and_sticky_writes(self):
+        token = {'HTTP_AUTHORIZATION': 'Token a'}
+        self.assertIn(self.request('get', **token), settings.REPLICA_DATABASES)
+        self.status = HTTPStatus.BAD_REQUEST
+        self.assertEqual(self.request('post', **token), 'default')
+        self.assertIn(self.request('get', **token), settings.REPLICA_DATABASES)
+        self.status = HTTPStatus.CREATED
+        self.request('post', **token)
+        self.status = HTTPStatus.OK
+        self.assertEqual(self.request('get', **token), 'default')
+        self.assertIn(
+            self.request('get', HTTP_AUTHORIZATION='Token b'),
+            settings.REPLICA_DATABASES)
+        self.assertIn(self.request('get'), settings.REPLICA_DATABASES)
+
+    def test_credentials_from_primary(self):
+        with read_from_replicas():
+            self.assertEqual(self.router.db_for_read(Token), 'default')
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+            self.assertIn(
+                self.router.db_for_read(User), settings.REPLICA_DATABASES)
+
+    @override_settings(REPLICA_DATABASES=[])
+    def test_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaMiddleware(self.get_response)
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_async(self):
+        """В режиме ASGI middleware остаётся асинхронной."""
+        async def get_response(request):
+            return self.get_response(request)
+
+        middleware = ReplicaMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        token = {'HTTP_AUTHORIZATION': 'Token a'}
+        async_to_sync(middleware)(self.factory.get('/', **token))
+        self.assertIn(self.db, settings.REPLICA_DATABASES)
+        self.status = HTTPStatus.CREATED
+        async_to_sync(middleware)(self.factory.post('/', **token))
+        self.status = HTTPStatus.OK
+        async_to_sync(middleware)(self.factory.get('/', **token))
+        self.assertEqual(self.db, 'default')
+
+    def test_shared_cache_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_cache()
+
+
+@override_settings(REPLICA_DATABASES=['replica_a', 'replica_b'])
+class ReplicaDatabasesTestCase(TestCase):
+    """
+    Чтение с настоящих реплик: две отдельные БД SQLite в памяти.
+    Реплики отстают: пользователей, токенов и сессий на них нет.
+    """
+
+    replicas = ('replica_a', 'replica_b')
+
+    @classmethod
+    def setUpClass(cls):
+        # Алиасы добавляются только на время класса, поэтому и доступ
+        # к ним разрешается здесь, а не в атрибуте класса.
+        cls.databases = {'default', *cls.replicas}
+        for alias in cls.replicas:
+            connections.settings[alias] = {
+                'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+            with connections[alias].schema_editor() as editor:
+                for model in (Tag, User, Token, Session, Subscribe):
+                    editor.create_model(model)
+            Tag.objects.using(alias).create(
+                name='С реплики', color='#000000', slug='replica')
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.replicas:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+    def setUp(self):
+        cache.clear()
+        Tag.objects.create(name='Основная', color='#ffffff', slug='primary')
+
+    def test_reads_from_replicas(self):
+        response = APIClient().get('/api/tags/')
+        self.assertEqual(
+            [tag['slug'] for tag in response.json()], ['replica'])
+        with read_from_replicas():
+            self.assertEqual(
+                list(Tag.objects.values_list('slug', flat=True)),
+                ['replica'])
+        self.assertEqual(
+            list(Tag.objects.values_list('slug', flat=True)), ['primary'])
+
+    def test_login_then_read(self):
+        """Токен из ответа на вход сразу работает для чтения."""
+        user = User.objects.create_user(
+            username='reader', email='reader@test.loc', password='QAZwsx!1',
+            first_name='Reader', last_name='Readerov')
+        client = APIClient()
+        response = client.post('/api/auth/token/login/', {
+            'email': 'reader@test.loc', 'password': 'QAZwsx!1',
+        }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        client.credentials(
+            HTTP_AUTHORIZATION='Token ' + response.data['auth_token'])
+        for url in ('/api/users/me/', f'/api/users/{user.pk}/'):
+            response = client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK, url)
+            self.assertEqual(response.data['username'], 'reader')
+        # Без закрепления и кэша токен всё равно читается с основной БД.
+        cache.clear()
+        response = client.get('/api/users/me/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_session_login_then_read(self):
+        """Новая сессия админки закрепляется за основной БД."""
+        User.objects.create_superuser(
+            username='admin', email='admin@test.loc', password='QAZwsx!1',
+            first_name='Admin', last_name='Adminov')
+        client = Client()
+        response = client.post('/admin/login/', {
+            'username': 'admin@test.loc', 'password': 'QAZwsx!1',
+            'next': '/admin/',
+        })
+        self.assertRedirects(response, '/admin/')
+        self.assertEqual(client.get('/admin/').status_code, HTTPStatus.OK)
@@ -1,7 +1,10 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet
+from api.views import (
+    DatabasePoolApiView, IngredientViewSet, RecipeViewSet, TagViewSet)
+from core.async_views import offload_patterns
 
 
 app_name = 'api'
@@ -11,6 +14,27 @@ router_v1.register('tags', TagViewSet)
 router_v1.register('ingredients', IngredientViewSet)
 router_v1.register('recipes', RecipeViewSet)
 
+# Маршруты, которые в режиме ASGI выполняются вне цикла событий.
+ASYNC_VIEWS = (
+    'tag-list',
+    'tag-detail',
+    'ingredient-list',
+    'ingredient-detail',
+    'recipe-list',
+    'recipe-detail',
+    'recipe-feed',
+    'recipe-download_shopping_cart',
+)
+
+api_urls = router_v1.urls
+if settings.ASYNC_VIEWS:
+    api_urls = offload_patterns(api_urls, ASYNC_VIEWS)
+
 urlpatterns = [
-    path('', include(router_v1.urls)),
+    path(
+        'diagnostics/db-pool/',
+        DatabasePoolApiView.as_view(),
+        name='db-pool'
+    ),
+    path('', include(api_urls)),
 ]
@@ -1,3 +1,6 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
@@ -7,45 +10,73 @@ from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.filters import IngredientsFilterSet, RecipeFilterSet
-from core.utils import get_pdf_shopping_list
+from api.filters import RecipeFilterSet
+from api.mixins import CatalogCacheMixin, SerializeTimingMixin
+from core.db.base import pool_stats
+from core.search import ingredient_index
+from core.toggles import add_recipe, remove_recipe
+from core.utils import annotate_authors, get_pdf_shopping_list
 from recipes.models import (
-    Ingredient, Recipe, ShoppingCart, Subscribe, Tag)
+    Favorite,
+    Ingredient,
+    Recipe,
+    ShoppingCart,
+    Subscribe,
+    Tag,
+)
 from users.models import User
-from .paginators import CustomPagination
+from .paginators import CustomCursorPagination, CustomPagination
 from .permissions import IsAuthorOrAdmin
 from .serializers import (
-    CartSerializer,
-    FavoriteSerializer,
     IngredientSeriaizer,
     RecipeCreateSerializer,
     RecipeShowSerializer,
+    RecipeShowShortSerializer,
     SubscribeSerializer,
     TagSeriaizer,
 )
 
+# Поля рецепта для краткого ответа (RecipeShowShortSerializer).
+SHORT_RECIPE_FIELDS = (
+    'id', 'name', 'image', 'image_thumbnail', 'image_webp', 'cooking_time')
+
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(
+    CatalogCacheMixin, SerializeTimingMixin, viewsets.ModelViewSet
+):
     """Вьюсет модели Тегов."""
 
+    catalog_name = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSeriaizer
     pagination_class = None
     permission_classes = [permissions.AllowAny]
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
-    """Вьюсет модели Ингредиентов."""
+class IngredientViewSet(
+    CatalogCacheMixin, SerializeTimingMixin, viewsets.ModelViewSet
+):
+    """
+    Вьюсет модели Ингредиентов.
+    Поиск '?name=' выполняется по индексу в памяти процесса:
+    сначала совпадения по началу названия, затем по подстроке.
+    """
 
+    catalog_name = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSeriaizer
     pagination_class = None
-    filter_backends = [DjangoFilterBackend]
-    filterset_class = IngredientsFilterSet
     permission_classes = [permissions.AllowAny]
 
+    def filter_queryset(self, queryset):
+        name = self.request.query_params.get('name')
+        if self.action == 'list' and name:
+            return ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT)
+        return super().filter_queryset(queryset)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(SerializeTimingMixin, viewsets.ModelViewSet):
     """
     Вьюсет модели Рецептов с дополнительными действиями
     относительно ендпойнтов:
@@ -54,7 +85,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         /download_shopping_cart
     """
 
-    queryset = Recipe.objects.all()
+    queryset = Recipe.objects.defer('search_vector')
     serializer_class = RecipeShowSerializer
     pagination_class = CustomPagination
     filter_backends = [DjangoFilterBackend]
@@ -62,14 +93,71 @@ class RecipeViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthorOrAdmin]
     http_method_names = ['get', 'post', 'patch', 'delete']
 
+    def get_queryset(self):
+        """
+        Рецепты вместе со всеми связанными данными за постоянное
+        число запросов: флаги текущего пользователя вычисляются
+        подзапросами EXISTS, автор подгружается отдельным запросом
+        на всю страницу. Теги и ингредиенты подгружает сериализатор
+        только для рецептов, которых нет в кэше фрагментов.
+        """
+        user = self.request.user
+        authors = User.objects.all()
+        queryset = Recipe.objects.defer('search_vector')
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(user=user, author=OuterRef('pk'))))
+            queryset = queryset.annotate(
+                favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+                in_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk'))),
+            )
+        if self.action == 'feed':
+            queryset = queryset.filter(in_feeds__user=user)
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors))
+
     def get_serializer_class(self):
         if self.request.method in ('POST', 'PATCH'):
             return RecipeCreateSerializer
         return RecipeShowSerializer
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
+    def toggle_recipe(self, request, pk, model, errors):
+        """
+        Добавление и удаление рецепта в избранном или корзине одним
+        запросом к БД без предварительных проверок; повторный
+        и одновременный запрос получает ошибку вместо дубля.
+        В ответе краткие данные рецепта.
+        """
+        user = request.user
+        if request.method == 'POST':
+            if add_recipe(model, user.pk, pk) is None:
+                get_object_or_404(Recipe, pk=pk)
+                return Response(
+                    {'errors': errors['exists']},
+                    status=status.HTTP_400_BAD_REQUEST)
+            recipe = Recipe.objects.only(*SHORT_RECIPE_FIELDS).get(pk=pk)
+            return Response(
+                RecipeShowShortSerializer(
+                    recipe, context={'request': request}).data,
+                status=status.HTTP_201_CREATED)
+
+        if not remove_recipe(model, user.pk, pk):
+            get_object_or_404(Recipe, pk=pk)
+            return Response(
+                {'errors': errors['missing']},
+                status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(
         detail=True,
         methods=['POST', 'DELETE'],
@@ -77,28 +165,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='favorite',
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def favorite(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if request.method == 'POST':
-            context = {'request': request}
-            data = {
-                'user': user.pk,
-                'recipe': recipe.pk,
-            }
-            serializer = FavoriteSerializer(data=data, context=context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        favorite = recipe.is_favorited.filter(user=user).first()
-        if not favorite:
-            return Response(
-                {'errors': 'Такого рецепта в избранном нет'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_recipe(request, pk, Favorite, {
+            'exists': 'Рецепт уже в избранном',
+            'missing': 'Такого рецепта в избранном нет',
+        })
 
     @action(
         detail=True,
@@ -107,28 +179,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
         url_path='shopping_cart',
         permission_classes=[permissions.IsAuthenticated]
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk=None):
-        user = request.user
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if request.method == 'POST':
-            context = {'request': request}
-            data = {
-                'user': user.pk,
-                'recipe': recipe.pk,
-            }
-            serializer = CartSerializer(data=data, context=context)
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-        if not recipe.in_shopping_cart.filter(user=user).exists():
-            return Response(
-                {'errors': 'Рецепта в корзине нет'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        cart = get_object_or_404(ShoppingCart, user=user, recipe=recipe)
-        cart.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.toggle_recipe(request, pk, ShoppingCart, {
+            'exists': 'Рецепт уже в КОРЗИНЕ',
+            'missing': 'Рецепта в корзине нет',
+        })
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        url_name='feed',
+        url_path='feed',
+        permission_classes=[permissions.IsAuthenticated],
+        pagination_class=CustomCursorPagination,
+    )
+    def feed(self, request):
+        """
+        Рецепты авторов из подписок, новые первыми. Читается из ленты
+        пользователя с пагинацией по ключу, поэтому не зависит от
+        количества подписок.
+        """
+        return self.list(request)
 
     @action(
         detail=False,
@@ -144,7 +216,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
             buffer, as_attachment=True, filename='your_shopping_cart.pdf')
 
 
-class SubscribtionsApiView(ListAPIView):
+class SubscriptionMixin:
+    """
+    Общая выборка авторов для ответов о подписках с учётом
+    параметра '?recipes_limit='.
+    """
+
+    def get_authors(self, authors):
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            recipes_limit = None
+        if recipes_limit is not None and recipes_limit < 0:
+            recipes_limit = None
+        return annotate_authors(authors, self.request.user, recipes_limit)
+
+
+class SubscribtionsApiView(
+    SubscriptionMixin, SerializeTimingMixin, ListAPIView
+):
     """
     Вьюсет модели Подписок, вызываемый
     ендпойнтом '/subscriptions'
@@ -157,16 +247,17 @@ class SubscribtionsApiView(ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        return User.objects.filter(subscribed__user=user)
+        return self.get_authors(User.objects.filter(subscribed__user=user))
 
 
-class SubscribeApiView(APIView):
+class SubscribeApiView(SubscriptionMixin, APIView):
     """
     Вьюсет, обрабатывающий добавление/удаление подписки.
     """
 
     permission_classes = [permissions.IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, id=None):
         user = request.user
         author = get_object_or_404(User, pk=id)
@@ -177,6 +268,8 @@ class SubscribeApiView(APIView):
         subscription = Subscribe(user=user, author=author)
         subscription.save()
 
+        author = self.get_authors(User.objects.filter(pk=author.pk)).get()
+        serializer = SubscribeSerializer(author, context=context)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id=None):
@@ -191,3 +284,21 @@ class SubscribeApiView(APIView):
         subscription = get_object_or_404(Subscribe, user=user, author=author)
         subscription.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class DatabasePoolApiView(APIView):
+    """
+    Статистика пулов соединений с БД процесса, обработавшего запрос:
+    занятые и свободные соединения, ожидания, пересоздания.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'pools': pool_stats(),
+            'conn_max_age': {
+                alias: database.get('CONN_MAX_AGE', 0)
+                for alias, database in settings.DATABASES.items()
+            },
+        })
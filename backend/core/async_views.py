@@ -0,0 +1,50 @@
+from functools import wraps
+from typing import Callable, Iterable, List
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.urls import URLPattern
+
+
+def offload(view: Callable) -> Callable:
+    """
+    Асинхронная обёртка синхронного view для работы под ASGI.
+    View вместе с рендерингом ответа выполняется в пуле потоков
+    (thread_sensitive=False), поэтому долгий запрос к БД или генерация
+    PDF не блокируют цикл событий и другие запросы. Соединения с БД
+    потоков пула закрываются так же, как в конце обычного запроса.
+    Атрибуты view (csrf_exempt и др.) сохраняются.
+    """
+
+    def run(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    run_in_thread = sync_to_async(run, thread_sensitive=False)
+
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await run_in_thread(request, *args, **kwargs)
+
+    return async_view
+
+
+def offload_patterns(
+    patterns: Iterable, names: Iterable[str]
+) -> List:
+    """Замена view маршрутов с указанными именами на offload(view)."""
+    names = set(names)
+    return [
+        URLPattern(
+            pattern.pattern, offload(pattern.callback),
+            pattern.default_args, pattern.name)
+        if isinstance(pattern, URLPattern) and pattern.name in names
+        else pattern
+        for pattern in patterns
+    ]
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш в памяти процесса.
+    Ограничен количеством записей и суммарным размером значений,
+    ведёт счётчики попаданий и промахов.
+    """
+
+    def __init__(
+        self,
+        max_items: int,
+        max_size: Optional[int] = None,
+        sizeof: Callable[[Any], int] = len,
+    ) -> None:
+        self.max_items = max_items
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            self.delete(key)
+            return
+        with self._lock:
+            if key in self._data:
+                self.size -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self._data and (
+                len(self._data) > self.max_items
+                or (self.max_size is not None and self.size > self.max_size)
+            ):
+                self.size -= self._data.popitem(last=False)[1][1]
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self.size -= self._data.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'items': len(self._data),
+            'size': self.size,
+        }
+
+
+def get_version(name: str) -> int:
+    """
+    Текущая версия именованного набора данных (каталога и т.п.).
+    Хранится в общем кэше Django, чтобы её изменение было видно
+    всем процессам. При отсутствии в кэше версия начинается
+    с текущего времени и не совпадает ни с одной из прежних.
+    """
+    key = f'version:{name}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name: str) -> None:
+    """
+    Смена версии набора данных после его изменения: сразу и ещё раз
+    после фиксации транзакции, чтобы ответ, построенный параллельным
+    запросом по прежним данным, не остался в кэше под новой версией.
+    """
+    key = f'version:{name}'
+
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+    bump()
+    transaction.on_commit(bump)
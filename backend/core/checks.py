@@ -0,0 +1,46 @@
+import os
+import shlex
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def configured_workers() -> int:
+    """
+    Число процессов сервера по WEB_CONCURRENCY и --workers/-w
+    из GUNICORN_CMD_ARGS (так их читает gunicorn).
+    """
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    args = shlex.split(os.getenv('GUNICORN_CMD_ARGS', ''))
+    for index, arg in enumerate(args):
+        if arg.startswith('--workers='):
+            workers = int(arg.partition('=')[2])
+        elif arg in ('--workers', '-w') and index + 1 < len(args):
+            workers = int(args[index + 1])
+        elif arg.startswith('-w') and arg[2:].isdigit():
+            workers = int(arg[2:])
+    return workers
+
+
+def check_shared_cache() -> None:
+    """
+    Версии справочников, фрагменты рецептов, токены и закрепление
+    клиентов за основной БД хранятся в кэше Django; кэш в памяти
+    процесса не видит изменений из других процессов, поэтому при
+    нескольких процессах или репликах БД сервер не запускается.
+    """
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES:
+        return
+    if configured_workers() > 1:
+        raise ImproperlyConfigured(
+            'При нескольких процессах сервера нужен общий кэш: '
+            'задайте CACHE_BACKEND и CACHE_LOCATION.')
+    if settings.REPLICA_DATABASES:
+        raise ImproperlyConfigured(
+            'С репликами БД (DB_REPLICAS) нужен общий кэш: '
+            'задайте CACHE_BACKEND и CACHE_LOCATION.')
@@ -0,0 +1,35 @@
+from django.db.models import Count, F, Model, OuterRef, QuerySet, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingCart, Subscribe
+from users.models import User
+
+
+# Денормализованные счётчики: (модель, поле-счётчик,
+# модель подсчитываемых записей, поле связи с моделью счётчика).
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'cart_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'author'),
+)
+
+
+def change_counter(queryset: QuerySet, field: str, delta: int) -> None:
+    """Атомарное изменение счётчика на стороне БД, не ниже нуля."""
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def count_subquery(model: Model, field: str) -> Coalesce:
+    """Подзапрос с количеством записей model, ссылающихся на строку."""
+    return Coalesce(
+        Subquery(
+            model.objects
+            .filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
@@ -0,0 +1,103 @@
+"""
+PostgreSQL с пулом соединений процесса:
+    'ENGINE': 'core.db',
+    'POOL': {'SIZE': 10, 'TIMEOUT': 10, 'CHECK_INTERVAL': 30,
+             'MAX_AGE': 1800},
+Закрытие соединения Django (в конце запроса при CONN_MAX_AGE=0)
+возвращает его в пул, новое соединение берётся из пула.
+"""
+import threading
+from typing import Dict
+
+from django.db.backends.postgresql import base, creation
+from psycopg2 import OperationalError, extensions
+
+from .pool import ConnectionPool, PoolTimeout
+
+pools: Dict[tuple, ConnectionPool] = {}
+pools_lock = threading.Lock()
+
+
+def check_connection(connection) -> None:
+    """Проверка соединения запросом к серверу."""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    reset_connection(connection)
+
+
+def reset_connection(connection) -> None:
+    """Откат незавершённой транзакции перед возвратом в пул."""
+    if connection.closed:
+        raise OperationalError('Соединение закрыто.')
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        raise OperationalError('Соединение потеряно.')
+    if status != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+def get_pool(alias: str, settings_dict: dict, conn_params: dict):
+    key = (alias, repr(sorted(conn_params.items())))
+    with pools_lock:
+        if key not in pools:
+            options = settings_dict.get('POOL', {})
+            pools[key] = ConnectionPool(
+                size=options.get('SIZE', 10),
+                timeout=options.get('TIMEOUT', 10),
+                check_interval=options.get('CHECK_INTERVAL', 30),
+                max_age=options.get('MAX_AGE'),
+                check=check_connection,
+                reset=reset_connection,
+            )
+        return pools[key]
+
+
+def pool_stats() -> Dict[str, dict]:
+    """Статистика пулов текущего процесса по алиасам БД."""
+    with pools_lock:
+        items = list(pools.items())
+    stats = {}
+    for (alias, _), pool in items:
+        name = alias if alias not in stats else f'{alias} ({len(stats)})'
+        stats[name] = pool.stats()
+    return stats
+
+
+def close_pools() -> None:
+    with pools_lock:
+        items = list(pools.values())
+    for pool in items:
+        pool.close_all()
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """Перед удалением и копированием тестовой БД закрывает пулы."""
+
+    def _clone_test_db(self, *args, **kwargs):
+        close_pools()
+        return super()._clone_test_db(*args, **kwargs)
+
+    def _destroy_test_db(self, *args, **kwargs):
+        close_pools()
+        return super()._destroy_test_db(*args, **kwargs)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, self.settings_dict, conn_params)
+        try:
+            connection = pool.acquire(
+                lambda: super(DatabaseWrapper, self).get_new_connection(
+                    conn_params))
+        except PoolTimeout as error:
+            raise OperationalError(str(error)) from error
+        self.isolation_level = connection.isolation_level
+        self.pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.release(self.connection)
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Optional
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за отведённое время."""
+
+
+class ConnectionPool:
+    """
+    Пул соединений процесса. Не создаёт больше size соединений,
+    при исчерпании ждёт освобождения до timeout секунд.
+    Соединение, простоявшее дольше check_interval секунд, перед выдачей
+    проверяется функцией check; соединения старше max_age закрываются.
+    Ведёт статистику выдач, ожиданий и пересоздания соединений.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        timeout: float = 10,
+        check_interval: float = 30,
+        max_age: Optional[float] = None,
+        check: Optional[Callable[[Any], None]] = None,
+        reset: Optional[Callable[[Any], None]] = None,
+    ):
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.check = check
+        self.reset = reset
+        self.generation = 0
+        self.open = 0
+        self.idle = deque()
+        self.in_use = {}
+        self.condition = threading.Condition()
+        self.counters = Counter()
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self, connect: Callable[[], Any]):
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self.condition:
+                while not self.idle and self.open >= self.size:
+                    remaining = started + self.timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.counters['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'Нет свободных соединений за {self.timeout} с.')
+                    waited = True
+                    self.condition.wait(remaining)
+                if waited:
+                    waited = False
+                    elapsed = time.monotonic() - started
+                    self.counters['waits'] += 1
+                    self.wait_time += elapsed
+                    self.max_wait_time = max(self.max_wait_time, elapsed)
+                entry = self.idle.pop() if self.idle else None
+                if entry is None:
+                    self.open += 1
+            if entry is None:
+                return self._create(connect)
+            connection, created, generation, released = entry
+            if self._usable(connection, created, generation, released):
+                with self.condition:
+                    self.in_use[id(connection)] = (created, generation)
+                    self.counters['acquired'] += 1
+                    self.counters['reused'] += 1
+                return connection
+            self._discard(connection)
+
+    def release(self, connection) -> None:
+        with self.condition:
+            created, generation = self.in_use.pop(
+                id(connection), (None, None))
+        if created is None:
+            connection.close()
+            return
+        try:
+            if self.reset is not None:
+                self.reset(connection)
+        except Exception:
+            self._discard(connection)
+            return
+        if not self._usable(connection, created, generation):
+            self._discard(connection)
+            return
+        with self.condition:
+            self.idle.append(
+                (connection, created, generation, time.monotonic()))
+            self.condition.notify()
+
+    def close_all(self) -> None:
+        """
+        Закрытие свободных соединений; занятые будут закрыты
+        при возврате в пул.
+        """
+        with self.condition:
+            self.generation += 1
+            idle, self.idle = self.idle, deque()
+        for connection, *_ in idle:
+            self._discard(connection)
+
+    def stats(self) -> Dict:
+        with self.condition:
+            acquired = self.counters['acquired']
+            return {
+                'pid': os.getpid(),
+                'size': self.size,
+                'open': self.open,
+                'in_use': len(self.in_use),
+                'idle': len(self.idle),
+                'acquired': acquired,
+                'created': self.counters['created'],
+                'closed': self.counters['closed'],
+                'reused': self.counters['reused'],
+                'health_checks': self.counters['health_checks'],
+                'failed_checks': self.counters['failed_checks'],
+                'waits': self.counters['waits'],
+                'timeouts': self.counters['timeouts'],
+                'wait_time_ms': round(self.wait_time * 1000, 1),
+                'max_wait_time_ms': round(self.max_wait_time * 1000, 1),
+                'avg_wait_time_ms': round(
+                    self.wait_time * 1000 / acquired, 3) if acquired else 0,
+            }
+
+    def _create(self, connect: Callable[[], Any]):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.in_use[id(connection)] = (time.monotonic(), self.generation)
+            self.counters['acquired'] += 1
+            self.counters['created'] += 1
+        return connection
+
+    def _usable(
+        self, connection, created: float, generation: int,
+        released: Optional[float] = None,
+    ) -> bool:
+        now = time.monotonic()
+        if generation != self.generation:
+            return False
+        if self.max_age is not None and now - created > self.max_age:
+            return False
+        if (released is None or self.check is None
+                or now - released < self.check_interval):
+            return True
+        try:
+            self.check(connection)
+        except Exception:
+            healthy = False
+        else:
+            healthy = True
+        with self.condition:
+            self.counters['health_checks'] += 1
+            self.counters['failed_checks'] += not healthy
+        return healthy
+
+    def _discard(self, connection) -> None:
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.open -= 1
+            self.counters['closed'] += 1
+            self.condition.notify()
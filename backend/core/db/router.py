@@ -0,0 +1,48 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Чтение с реплик разрешается только явно (ReplicaMiddleware для
+# безопасных запросов); команды, сигналы и запросы на запись
+# работают с основной БД.
+replica_reads = ContextVar('replica_reads', default=False)
+
+# Токены и сессии только что вошедших клиентов могут ещё не дойти
+# до реплик, поэтому всегда читаются с основной БД.
+PRIMARY_APPS = ('authtoken', 'sessions')
+
+
+@contextmanager
+def read_from_replicas(enabled: bool = True):
+    token = replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение - со случайной реплики из REPLICA_DATABASES, если оно
+    разрешено в текущем контексте и модель не из PRIMARY_APPS,
+    иначе и запись - с основной БД.
+    Миграции применяются только к основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        if (settings.REPLICA_DATABASES and replica_reads.get()
+                and model._meta.app_label not in PRIMARY_APPS):
+            return random.choice(settings.REPLICA_DATABASES)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from core.models import bulk_insert
+from recipes.models import FeedEntry, Recipe, Subscribe
+
+
+def fan_out(recipe: Recipe) -> None:
+    """Добавление нового рецепта в ленты подписчиков автора."""
+    followers = Subscribe.objects.filter(
+        author_id=recipe.author_id).values_list('user_id', flat=True)
+    bulk_insert(
+        FeedEntry,
+        (FeedEntry(user_id=user_id, recipe=recipe, author_id=recipe.author_id)
+         for user_id in followers.iterator()),
+        ignore_conflicts=True)
+
+
+def backfill(user_id: int, author_id: int) -> None:
+    """Последние FEED_BACKFILL_LIMIT рецептов автора в ленту подписчика."""
+    recipes = (
+        Recipe.objects.filter(author_id=author_id)
+        .order_by('-id').values_list('pk', flat=True)
+        [:settings.FEED_BACKFILL_LIMIT]
+    )
+    bulk_insert(
+        FeedEntry,
+        (FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+         for recipe_id in recipes),
+        ignore_conflicts=True)
+
+
+def prune(user_id: int, author_id: int) -> None:
+    """Удаление рецептов автора из ленты отписавшегося."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_feeds(users: QuerySet) -> None:
+    """
+    Пересборка лент пользователей по их подпискам, например после
+    массовой вставки подписок в обход сигналов.
+    """
+    FeedEntry.objects.filter(user__in=users).delete()
+    subscriptions = Subscribe.objects.filter(user__in=users).values_list(
+        'user_id', 'author_id')
+    recipes = defaultdict(list)
+    for author_id, recipe_id in (
+        Recipe.objects.filter(author__in=subscriptions.values('author_id'))
+        .order_by('-id').values_list('author_id', 'pk').iterator()
+    ):
+        if len(recipes[author_id]) < settings.FEED_BACKFILL_LIMIT:
+            recipes[author_id].append(recipe_id)
+    bulk_insert(
+        FeedEntry,
+        (FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+         for user_id, author_id in subscriptions.iterator()
+         for recipe_id in recipes[author_id]),
+    )
@@ -0,0 +1,100 @@
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import PurePath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, features
+
+from core.utils import invalidate_recipe_fragments
+from recipes.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FIELDS = ('image_thumbnail', 'image_webp')
+
+executor = ThreadPoolExecutor(
+    max_workers=max(settings.IMAGE_WORKERS, 1),
+    thread_name_prefix='recipe-images',
+)
+
+
+def schedule_image_variants(recipe: Recipe) -> None:
+    """
+    Постановка построения вариантов изображения сохранённого рецепта
+    в очередь после фиксации транзакции. Текущие варианты
+    сбрасываются, до готовности новых сериализаторы отдают оригинал.
+    """
+    old_files = [
+        getattr(recipe, field) for field in VARIANT_FIELDS
+        if getattr(recipe, field)
+    ]
+    if old_files:
+        for field in VARIANT_FIELDS:
+            setattr(recipe, field, None)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            **dict.fromkeys(VARIANT_FIELDS))
+
+    def submit():
+        for file in old_files:
+            file.storage.delete(file.name)
+        if settings.IMAGE_WORKERS:
+            executor.submit(build_image_variants, recipe.pk)
+        else:
+            build_image_variants(recipe.pk)
+
+    transaction.on_commit(submit)
+
+
+def encode(image: Image.Image, image_format: str, **options) -> ContentFile:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def build_image_variants(recipe_id: int) -> None:
+    """
+    Построение уменьшенных копий изображения рецепта в JPEG и WebP.
+    Выполняется в фоновом потоке, ошибки только логируются.
+    """
+    try:
+        recipe = Recipe.objects.only('image').get(pk=recipe_id)
+        if not recipe.image:
+            return
+        with recipe.image.open('rb') as file:
+            image = Image.open(file)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(
+                (settings.IMAGE_THUMBNAIL_SIZE, settings.IMAGE_THUMBNAIL_SIZE))
+            image = image.convert('RGB')
+
+        storage = recipe.image.storage
+        stem = PurePath(recipe.image.name).stem
+        variants = {
+            'image_thumbnail': storage.save(
+                f'thumbnails/{stem}.jpg',
+                encode(image, 'JPEG', quality=80, optimize=True,
+                       progressive=True)),
+        }
+        if features.check('webp'):
+            variants['image_webp'] = storage.save(
+                f'thumbnails/{stem}.webp',
+                encode(image, 'WEBP', quality=75, method=4))
+
+        updated = Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name).update(**variants)
+        if updated:
+            invalidate_recipe_fragments([recipe_id])
+        else:
+            for name in variants.values():
+                storage.delete(name)
+    except Exception:
+        logger.exception(
+            'Не удалось построить варианты изображения рецепта %s',
+            recipe_id)
+    finally:
+        if settings.IMAGE_WORKERS:
+            connections.close_all()
@@ -0,0 +1,212 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from core.db.router import read_from_replicas
+
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RequestTiming:
+    """Замеры одного запроса; вызывается как execute_wrapper соединений."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = self.view_finished = self.render_finished = None
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+        self.statement_time = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            self.queries += 1
+            self.statements[sql] += 1
+            self.statement_time[sql] += elapsed
+
+    def finish_render(self, response):
+        self.render_finished = time.perf_counter()
+        return response
+
+    def metrics(self) -> dict:
+        """Длительности этапов в миллисекундах."""
+        finished = time.perf_counter()
+        view_finished = self.view_finished or finished
+        view = view_finished - (self.view_started or self.started)
+        metrics = {
+            'total': finished - self.started,
+            'db': self.db_time,
+            'view': view - self.serialize_time,
+            'serialize': self.serialize_time,
+        }
+        if self.render_finished:
+            metrics['render'] = self.render_finished - view_finished
+        return {name: value * 1000 for name, value in metrics.items()}
+
+
+class RequestTimingMiddleware:
+    """
+    Время запроса, его обращений к БД, работы view, сериализации
+    (замеряет api.mixins.SerializeTimingMixin, вычитается из view)
+    и рендеринга ответа в заголовке Server-Timing; запросы дольше
+    SLOW_REQUEST_MS пишутся в лог вместе с самыми частыми SQL-запросами.
+    При REQUEST_TIMING=False middleware отключается при старте.
+    Должна стоять первой в MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timing = request._timing = RequestTiming()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timing))
+            response = self.get_response(request)
+        metrics = timing.metrics()
+        response['Server-Timing'] = ', '.join(
+            f'{name};dur={value:.1f}' + (
+                f';desc="{timing.queries} queries"' if name == 'db' else '')
+            for name, value in metrics.items()
+        )
+        if metrics['total'] >= settings.SLOW_REQUEST_MS:
+            self.log_slow_request(request, response, timing, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = request._timing
+        timing.view_finished = time.perf_counter()
+        response.add_post_render_callback(timing.finish_render)
+        return response
+
+    @staticmethod
+    def log_slow_request(request, response, timing, metrics):
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'queries': timing.queries,
+            **{f'{name}_ms': round(value, 1)
+               for name, value in metrics.items()},
+            'top_queries': [
+                {
+                    'sql': sql,
+                    'count': count,
+                    'ms': round(timing.statement_time[sql] * 1000, 1),
+                }
+                for sql, count in timing.statements.most_common(
+                    settings.SLOW_REQUEST_TOP_QUERIES)
+            ],
+        }, ensure_ascii=False))
+
+
+class ReplicaMiddleware:
+    """
+    Безопасные запросы (GET, HEAD, OPTIONS) читают с реплик БД.
+    После успешного запроса на запись клиент на REPLICA_STICKY_SECONDS
+    закрепляется за основной БД, чтобы видеть свои изменения
+    несмотря на отставание реплик. Клиент определяется без обращения
+    к БД по токену из заголовка Authorization и по cookie сессии,
+    в том числе выданным ответом на вход; отметка хранится в общем
+    кэше. Работает и в синхронном, и в асинхронном режиме (ASGI), не
+    переводя асинхронные запросы в один поток.
+    Без реплик отключается при старте.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REPLICA_DATABASES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Признак корутины для обработчика Django, как
+            # в MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        keys = self.client_keys(request)
+        safe = request.method in SAFE_METHODS
+        sticky = bool(keys) and safe and bool(cache.get_many(keys))
+        with read_from_replicas(safe and not sticky):
+            response = self.get_response(request)
+        keys = self.sticky_keys(request, response, keys)
+        if keys:
+            cache.set_many(
+                dict.fromkeys(keys, True), settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        keys = self.client_keys(request)
+        safe = request.method in SAFE_METHODS
+        sticky = bool(keys) and safe and bool(await sync_to_async(
+            cache.get_many, thread_sensitive=False)(keys))
+        with read_from_replicas(safe and not sticky):
+            response = await self.get_response(request)
+        keys = self.sticky_keys(request, response, keys)
+        if keys:
+            await sync_to_async(cache.set_many, thread_sensitive=False)(
+                dict.fromkeys(keys, True), settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    @classmethod
+    def client_keys(cls, request) -> list:
+        """Ключи кэша клиента: по токену и по cookie сессии."""
+        authorization = request.META.get('HTTP_AUTHORIZATION', '').split()
+        return [
+            cls.sticky_key(credential) for credential in (
+                authorization[-1] if authorization else None,
+                request.COOKIES.get(settings.SESSION_COOKIE_NAME),
+            ) if credential
+        ]
+
+    @classmethod
+    def sticky_keys(cls, request, response, keys) -> list:
+        """
+        Ключи клиентов, закрепляемых после успешной записи: клиент
+        запроса, токен из ответа на вход и новая cookie сессии.
+        """
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return []
+        data = getattr(response, 'data', None)
+        session = response.cookies.get(settings.SESSION_COOKIE_NAME)
+        return keys + [
+            cls.sticky_key(credential) for credential in (
+                data.get('auth_token') if isinstance(data, dict) else None,
+                session.value if session else None,
+            ) if credential
+        ]
+
+    @staticmethod
+    def sticky_key(credential: str) -> str:
+        digest = hashlib.sha256(credential.encode()).hexdigest()
+        return f'replica-sticky:{digest}'
@@ -0,0 +1,45 @@
+from itertools import islice
+from typing import Iterable, Type
+
+from django.db import models
+
+BATCH_SIZE = 1000
+
+
+def bulk_insert(
+    model: Type[models.Model], objs: Iterable[models.Model], **kwargs
+) -> None:
+    """
+    Вставка записей model пачками по BATCH_SIZE без загрузки всех
+    записей в память; kwargs передаются в bulk_create.
+    """
+    objs = iter(objs)
+    while True:
+        batch = list(islice(objs, BATCH_SIZE))
+        if not batch:
+            return
+        model.objects.bulk_create(batch, **kwargs)
+
+
+class ProtectedFieldsMixin:
+    """
+    Поля protected_fields поддерживаются на стороне БД (счётчики
+    через F(), триггеры), поэтому обычное сохранение существующей
+    записи их не перезаписывает значениями, прочитанными ранее.
+    Явно перечисленные в update_fields поля сохраняются.
+    """
+
+    protected_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not args and not self._state.adding
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.protected_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,35 @@
+from typing import FrozenSet, Optional
+
+from django.http import HttpRequest
+
+from recipes.models import Favorite, ShoppingCart, Subscribe
+
+# Связи текущего пользователя: имя -> (модель, поле с id объекта).
+RELATIONS = {
+    'subscriptions': (Subscribe, 'author_id'),
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'recipe_id'),
+}
+
+
+def related_ids(request: Optional[HttpRequest], name: str) -> FrozenSet[int]:
+    """
+    Множество id авторов или рецептов, связанных с пользователем
+    запроса (см. RELATIONS). Загружается одним запросом при первом
+    обращении и запоминается до конца запроса, поэтому флаги
+    is_subscribed, is_favorited, is_in_shopping_cart для любого
+    числа объектов проверяются без обращений к БД.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    # У запроса DRF общий с ним HttpRequest: множества доступны всем
+    # сериализаторам и обёрткам запроса.
+    memo = getattr(request, '_request', request).__dict__.setdefault(
+        '_related_ids', {})
+    if name not in memo:
+        model, field = RELATIONS[name]
+        memo[name] = frozenset(
+            model.objects.filter(user=request.user)
+            .values_list(field, flat=True)
+        )
+    return memo[name]
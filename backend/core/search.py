@@ -0,0 +1,105 @@
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from typing import Iterable, List, Tuple
+
+from core.cache import get_version
+from recipes.models import Ingredient
+
+
+def normalize(text: str) -> str:
+    """Приведение строки к виду для сравнения без учёта регистра."""
+    return text.casefold().replace('ё', 'е')
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Индекс для поиска по названию в памяти процесса.
+    Совпадения по началу названия идут раньше совпадений
+    по подстроке, внутри каждой группы - по алфавиту.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, object]]) -> None:
+        entries = sorted(
+            (normalize(name), position, value)
+            for position, (name, value) in enumerate(items)
+        )
+        self._keys = [key for key, _, _ in entries]
+        self._values = [value for _, _, value in entries]
+        self._trigrams = defaultdict(set)
+        for position, key in enumerate(self._keys):
+            for trigram in trigrams(key):
+                self._trigrams[trigram].add(position)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def search(self, query: str, limit: int) -> List[object]:
+        query = normalize(query.strip())
+        if not query:
+            return self._values[:limit]
+
+        result = []
+        position = bisect_left(self._keys, query)
+        while (position < len(self._keys) and len(result) < limit
+               and self._keys[position].startswith(query)):
+            result.append(position)
+            position += 1
+        if len(result) >= limit:
+            return [self._values[position] for position in result]
+
+        if len(query) >= 3:
+            candidates = set.intersection(*(
+                self._trigrams.get(trigram, set())
+                for trigram in trigrams(query)
+            ))
+        else:
+            candidates = range(len(self._keys))
+        prefixes = set(result)
+        for position in sorted(candidates):
+            if position not in prefixes and query in self._keys[position]:
+                result.append(position)
+                if len(result) >= limit:
+                    break
+        return [self._values[position] for position in result]
+
+
+class IngredientIndex:
+    """
+    Поисковый индекс по каталогу ингредиентов. Перестраивается
+    при смене версии каталога 'ingredients', которую меняют
+    сигналы сохранения и удаления Ingredient.
+    """
+
+    def __init__(self) -> None:
+        self._index = None
+        self._version = None
+        self._lock = Lock()
+
+    def get_index(self) -> SearchIndex:
+        version = get_version('ingredients')
+        if self._index is None or self._version != version:
+            with self._lock:
+                if self._index is None or self._version != version:
+                    self._index = SearchIndex(
+                        (name, (pk, name, measurement_unit))
+                        for pk, name, measurement_unit
+                        in Ingredient.objects.values_list(
+                            'pk', 'name', 'measurement_unit')
+                    )
+                    self._version = version
+        return self._index
+
+    def search(self, query: str, limit: int) -> List[Ingredient]:
+        return [
+            Ingredient(pk=pk, name=name, measurement_unit=measurement_unit)
+            for pk, name, measurement_unit
+            in self.get_index().search(query, limit)
+        ]
+
+
+ingredient_index = IngredientIndex()
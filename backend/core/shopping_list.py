@@ -0,0 +1,96 @@
+from typing import Dict
+
+from django.db import connection
+from django.db.models import QuerySet, Sum
+
+from core.models import bulk_insert
+from recipes.models import (
+    RecipeIngredient, ShoppingCart, ShoppingListItem)
+
+# Прибавление к итогам списка покупок строк (user_id, ingredient_id,
+# total) из SELECT одним запросом; синтаксис общий для PostgreSQL
+# и SQLite 3.24+.
+UPSERT_SQL = (
+    'INSERT INTO {table} (user_id, ingredient_id, total) {select} '
+    'ON CONFLICT (user_id, ingredient_id) '
+    'DO UPDATE SET total = {table}.total + excluded.total'
+)
+
+
+def upsert(select: str, params: list) -> None:
+    table = connection.ops.quote_name(ShoppingListItem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_SQL.format(table=table, select=select), params)
+
+
+def change_recipe_in_list(user_id: int, recipe_id: int, sign: int) -> None:
+    """
+    Добавление (sign=1) или вычитание (sign=-1) ингредиентов рецепта
+    в списке покупок пользователя.
+    """
+    upsert(
+        'SELECT %s, ingredient_id, %s * amount FROM {} '
+        'WHERE recipe_id = %s'.format(
+            connection.ops.quote_name(RecipeIngredient._meta.db_table)),
+        [user_id, sign, recipe_id],
+    )
+    if sign < 0:
+        ShoppingListItem.objects.filter(user_id=user_id, total__lte=0).delete()
+
+
+def apply_ingredient_deltas(recipe_id: int, deltas: Dict[int, int]) -> None:
+    """
+    Изменение итогов у всех, чья корзина содержит рецепт:
+    deltas - {ingredient_id: изменение количества в рецепте}.
+    Все изменения применяются одним запросом: в PostgreSQL пары
+    передаются массивами через unnest, в остальных СУБД - через
+    UNION ALL.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas or not ShoppingCart.objects.filter(
+            recipe_id=recipe_id).exists():
+        return
+    if connection.vendor == 'postgresql':
+        rows = ('unnest(%s::bigint[], %s::integer[]) '
+                'AS d (ingredient_id, delta)')
+        params = [list(deltas), list(deltas.values())]
+    else:
+        rows = '({}) AS d'.format(' UNION ALL '.join(
+            ['SELECT %s AS ingredient_id, %s AS delta']
+            + ['SELECT %s, %s'] * (len(deltas) - 1)))
+        params = [value for item in deltas.items() for value in item]
+    upsert(
+        'SELECT c.user_id, d.ingredient_id, d.delta '
+        'FROM {} AS c CROSS JOIN {} WHERE c.recipe_id = %s'.format(
+            connection.ops.quote_name(ShoppingCart._meta.db_table), rows),
+        [*params, recipe_id],
+    )
+    ShoppingListItem.objects.filter(
+        user__shopping_cart__recipe_id=recipe_id,
+        ingredient_id__in=list(deltas),
+        total__lte=0,
+    ).delete()
+
+
+def expected_items(users: QuerySet) -> QuerySet:
+    """Итоги списков покупок, пересчитанные по корзинам."""
+    return (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_cart__user__in=users)
+        .values_list('recipe__in_shopping_cart__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+
+def rebuild_shopping_lists(users: QuerySet) -> None:
+    """Пересборка итогов списков покупок пользователей с нуля."""
+    ShoppingListItem.objects.filter(user__in=users).delete()
+    bulk_insert(
+        ShoppingListItem,
+        (ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, total=total)
+         for user_id, ingredient_id, total
+         in expected_items(users).iterator()),
+    )
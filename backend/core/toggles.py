@@ -0,0 +1,67 @@
+from typing import Optional, Type
+
+from django.db import connection, models
+from django.db.models.signals import post_delete, post_save, pre_delete
+
+from recipes.models import Recipe
+
+# Добавление связи пользователя с рецептом одним запросом: повтор
+# и одновременные запросы не нарушают уникальность, а несуществующий
+# рецепт не даёт строки для вставки. Синтаксис общий для PostgreSQL
+# и SQLite 3.35+.
+INSERT_SQL = (
+    'INSERT INTO {table} (user_id, recipe_id) '
+    'SELECT %s, id FROM {recipes} WHERE id = %s '
+    'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+    'RETURNING id'
+)
+DELETE_SQL = 'DELETE FROM {table} WHERE id = %s RETURNING id'
+
+
+def execute(model: Type[models.Model], sql: str, params: list):
+    with connection.cursor() as cursor:
+        cursor.execute(sql.format(
+            table=connection.ops.quote_name(model._meta.db_table),
+            recipes=connection.ops.quote_name(Recipe._meta.db_table),
+        ), params)
+        return cursor.fetchone()
+
+
+def add_recipe(
+    model: Type[models.Model], user_id: int, recipe_id: int
+) -> Optional[models.Model]:
+    """
+    Добавление рецепта в избранное или корзину (model).
+    Возвращает созданную запись или None, если запись уже есть
+    или рецепта нет. Сигналы модели отправляются вручную, чтобы
+    обновились счётчики, кэши и список покупок.
+    """
+    row = execute(model, INSERT_SQL, [user_id, recipe_id])
+    if row is None:
+        return None
+    instance = model(id=row[0], user_id=user_id, recipe_id=recipe_id)
+    post_save.send(
+        sender=model, instance=instance, created=True, update_fields=None,
+        raw=False, using=connection.alias)
+    return instance
+
+
+def remove_recipe(
+    model: Type[models.Model], user_id: int, recipe_id: int
+) -> bool:
+    """
+    Удаление рецепта из избранного или корзины (model); False, если
+    записи не было. Запись блокируется до удаления, чтобы pre_delete
+    получил существующую строку, а повторный запрос дождался удаления
+    и не нашёл её. Вызывается внутри транзакции.
+    """
+    pk = model.objects.select_for_update().filter(
+        user_id=user_id, recipe_id=recipe_id).values_list(
+        'pk', flat=True).first()
+    if pk is None:
+        return False
+    instance = model(id=pk, user_id=user_id, recipe_id=recipe_id)
+    pre_delete.send(sender=model, instance=instance, using=connection.alias)
+    execute(model, DELETE_SQL, [pk])
+    post_delete.send(sender=model, instance=instance, using=connection.alias)
+    return True
@@ -1,34 +1,96 @@
 import io
+from typing import Optional
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Exists, F, OuterRef, Prefetch, QuerySet, Subquery)
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from rest_framework import serializers
 from rest_framework.request import Request
 
+from core.cache import LRUCache
+from core.shopping_list import apply_ingredient_deltas
 from foodgram_backend.settings import FONT_SIZE
-from recipes.models import Recipe, RecipeIngredient, RecipeTag
+from recipes.models import (
+    Recipe, RecipeIngredient, RecipeTag, ShoppingListItem, Subscribe)
+from users.models import User
+
+
+shopping_list_cache = LRUCache(
+    settings.SHOPPING_LIST_CACHE_ITEMS,
+    settings.SHOPPING_LIST_CACHE_SIZE,
+)
+
+
+def bump_shopping_cart_version(users: QuerySet) -> None:
+    """
+    Увеличение версии корзины пользователей: закэшированные
+    списки покупок с прежней версией больше не используются.
+    """
+    users.update(shopping_cart_version=F('shopping_cart_version') + 1)
+
+
+def recipe_fragment_key(pk: int) -> str:
+    """Ключ кэша сериализованного фрагмента рецепта."""
+    return f'recipe-fragment:{pk}'
+
+
+def invalidate_recipe_fragments(pks) -> None:
+    """
+    Удаление из кэша фрагментов рецептов после их изменения: сразу
+    и ещё раз после фиксации транзакции, так как до неё параллельный
+    запрос может закэшировать фрагмент по прежним данным.
+    """
+    keys = [recipe_fragment_key(pk) for pk in pks]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_shopping_list(user: User) -> QuerySet:
+    """
+    Список покупок пользователя: готовые итоги по ингредиентам
+    из таблицы ShoppingListItem, чтение по индексу пользователя.
+    Элементы - словари с ключами name, measurement_unit, total.
+    """
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values(
+            'total',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        )
+        .order_by('name', 'measurement_unit')
+    )
 
 
 def get_pdf_shopping_list(request: Request) -> io.BytesIO:
     """
-    Сбор ингредиентов из рецептов в корзине с суммированием
-    количества свопадающих и возврат в pdf.
+    Список покупок пользователя в формате pdf.
+    Готовый документ кэшируется до изменения версии корзины.
     """
     user = request.user
-    recipes = Recipe.objects.filter(in_shopping_cart__user=user)
-    ingr_total = {}
+    version = User.objects.filter(pk=user.pk).values_list(
+        'shopping_cart_version', flat=True).get()
+    key = (user.pk, version)
+    cached = shopping_list_cache.get(key)
+    if cached is not None:
+        return io.BytesIO(cached)
+
+    buffer = render_pdf_shopping_list(get_shopping_list(user))
+    shopping_list_cache.set(key, buffer.getvalue())
+    return buffer
 
-    for recipe in recipes:
-        recipe_ingrs = recipe.with_ingredients.all()
-        for ingredient in recipe_ingrs:
-            if ingredient.ingredient in ingr_total:
-                ingr_total[ingredient.ingredient] += ingredient.amount
-            else:
-                ingr_total[ingredient.ingredient] = ingredient.amount
 
+def render_pdf_shopping_list(shopping_list: QuerySet) -> io.BytesIO:
+    """Отрисовка списка покупок в pdf."""
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=A4, bottomup=0)
     textobj = pdf.beginText(inch, inch)
@@ -36,9 +98,8 @@ def get_pdf_shopping_list(request: Request) -> io.BytesIO:
         'Verdana', 'core/Verdana.ttf'))
     textobj.setFont('Verdana', FONT_SIZE)
 
-    for ingredient, amount in ingr_total.items():
-        textobj.textLine(
-            f'{ingredient.name}: {amount} {ingredient.measurement_unit}')
+    for item in shopping_list:
+        textobj.textLine('{name}: {total} {measurement_unit}'.format(**item))
 
     pdf.drawText(textobj)
     pdf.showPage()
@@ -48,23 +109,94 @@ def get_pdf_shopping_list(request: Request) -> io.BytesIO:
     return buffer
 
 
-def ingredients_tags_action(recipe: Recipe, ingrs: list, tags: list) -> None:
-    """Метод комплексного добавления/обновления ингредиентов и тегов"""
+def ingredients_tags_action(
+    recipe: Recipe,
+    ingrs: Optional[list] = None,
+    tags: Optional[list] = None,
+) -> None:
+    """
+    Метод комплексного добавления/обновления ингредиентов и тегов.
+    Текущие связи сравниваются с переданными, в БД применяется
+    только разница (вставка, изменение количества, удаление) в одной
+    транзакции. ingrs - список словарей с ключами ingredient_id
+    и amount, tags - список id тегов; None - связь не меняется.
+    """
+    ingredients_changed = tags_changed = False
+    deltas = {}
+    with transaction.atomic():
+        if ingrs is not None:
+            amounts = {item['ingredient_id']: item['amount'] for item in ingrs}
+            existing = {
+                row.ingredient_id: row
+                for row in RecipeIngredient.objects.filter(recipe=recipe)
+            }
+            to_delete = []
+            for ingredient_id, row in existing.items():
+                if ingredient_id not in amounts:
+                    to_delete.append(row.pk)
+                    deltas[ingredient_id] = -row.amount
+            to_update = []
+            to_create = []
+            for ingredient_id, amount in amounts.items():
+                row = existing.get(ingredient_id)
+                if row is None:
+                    to_create.append(RecipeIngredient(
+                        recipe=recipe,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    ))
+                    deltas[ingredient_id] = amount
+                elif row.amount != amount:
+                    deltas[ingredient_id] = amount - row.amount
+                    row.amount = amount
+                    to_update.append(row)
+            if to_delete:
+                RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+            if to_update:
+                RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+            if to_create:
+                RecipeIngredient.objects.bulk_create(to_create)
+            ingredients_changed = bool(to_delete or to_update or to_create)
+
+        if tags is not None:
+            tags = set(tags)
+            existing = set(RecipeTag.objects.filter(
+                recipe=recipe).values_list('tag_id', flat=True))
+            if existing - tags:
+                RecipeTag.objects.filter(
+                    recipe=recipe, tag_id__in=existing - tags).delete()
+            if tags - existing:
+                RecipeTag.objects.bulk_create(
+                    RecipeTag(recipe=recipe, tag_id=tag_id)
+                    for tag_id in tags - existing)
+            tags_changed = existing != tags
 
-    try:
-        recipe.with_ingredients.all().delete()
-        batch_ingrs = [
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=ingredient['ingredient'],
-                amount=ingredient['amount']
-            ) for ingredient in ingrs
-        ]
-        RecipeIngredient.objects.bulk_create(batch_ingrs)
+        if ingredients_changed:
+            apply_ingredient_deltas(recipe.pk, deltas)
+            bump_shopping_cart_version(
+                User.objects.filter(shopping_cart__recipe=recipe))
+        if ingredients_changed or tags_changed:
+            invalidate_recipe_fragments([recipe.pk])
 
-        recipe.with_tags.all().delete()
-        batch_tags = [RecipeTag(recipe=recipe, tag=tag) for tag in tags]
-        RecipeTag.objects.bulk_create(batch_tags)
 
-    except Exception as ex:
-        raise serializers.ErrorDetail(ex)
+def annotate_authors(
+    authors: QuerySet, user: User, recipes_limit: Optional[int] = None
+) -> QuerySet:
+    """
+    Авторы для вывода в подписках: признак подписки вычисляется
+    в основном запросе, последние recipes_limit рецептов каждого
+    автора подгружаются одним запросом (коррелированный подзапрос
+    с LIMIT на автора).
+    """
+    recipes = Recipe.objects.defer('search_vector')
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects
+            .filter(author=OuterRef('author'))
+            .order_by('-id')
+            .values('pk')[:recipes_limit]
+        ))
+    return authors.annotate(
+        is_subscribed=Exists(
+            Subscribe.objects.filter(user=user, author=OuterRef('pk'))),
+    ).prefetch_related(Prefetch('recipes', queryset=recipes))
@@ -2,6 +2,10 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from core.checks import check_shared_cache
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
 application = get_asgi_application()
+
+check_shared_cache()
@@ -1,14 +1,29 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe, SafeString
 
+from core.images import schedule_image_variants
+from core.shopping_list import rebuild_shopping_lists
+from core.utils import bump_shopping_cart_version
 from foodgram_backend.settings import MIN_VALUE
+from users.models import User
 from .models import (
     Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, Subscribe, Tag)
 
 
+def rebuild_carts_with(recipe_ids) -> None:
+    """
+    Пересборка списков покупок после правки ингредиентов в админке,
+    которая идёт в обход ingredients_tags_action.
+    """
+    users = User.objects.filter(shopping_cart__recipe__in=recipe_ids)
+    rebuild_shopping_lists(users)
+    bump_shopping_cart_version(users)
+
+
 class TagInline(admin.TabularInline):
     model = RecipeTag
     extra = 0
+    autocomplete_fields = ('tag',)
     verbose_name = 'Тег рецепта'
     verbose_name_plural = 'Теги рецепта'
 
@@ -17,6 +32,7 @@ class IngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 0
     min_num = MIN_VALUE
+    autocomplete_fields = ('ingredient',)
     verbose_name = 'Ингредиент рецепта'
     verbose_name_plural = 'Ингредиенты рецепта'
 
@@ -42,43 +58,79 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'name', 'author', 'cooking_time', 'get_favorited', 'get_image',)
-    readonly_fields = ('author',)
     list_display_links = ('name',)
-    search_fields = ('name', 'tags', 'author')
-    list_filter = ('name', 'tags__name', 'author__username')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     inlines = (TagInline, IngredientInline)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('search_vector')
+
     def get_favorited(self, obj: Recipe) -> int:
-        return obj.is_favorited.count()
+        return obj.favorites_count
 
     get_favorited.short_description = 'В избранном'
+    get_favorited.admin_order_field = 'favorites_count'
 
     def get_image(self, obj: Recipe) -> SafeString:
-        if obj.image:
-            return mark_safe(f'<img src={obj.image.url} width=50>')
+        image = obj.image_thumbnail or obj.image
+        if image:
+            return mark_safe(f'<img src={image.url} width=50>')
 
     get_image.short_description = 'Изображение'
 
     def save_model(self, request, obj, form, change):
-        obj.author = request.user
+        if not obj.author_id:
+            obj.author = request.user
         super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_image_variants(obj)
+
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is RecipeIngredient and formset.has_changed():
+            rebuild_carts_with([form.instance.pk])
 
 
 @admin.register(Subscribe)
 class SubscribeAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        rebuild_carts_with([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_carts_with([obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = list(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_carts_with(recipe_ids)
 
 
 @admin.register(RecipeTag)
 class RecipeTagAdmin(admin.ModelAdmin):
     list_display = ('id', 'recipe', 'tag')
+    list_select_related = ('recipe', 'tag')
+    autocomplete_fields = ('recipe', 'tag')
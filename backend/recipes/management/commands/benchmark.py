@@ -0,0 +1,303 @@
+import json
+import math
+import platform
+import tempfile
+import time
+from contextlib import ExitStack
+from statistics import mean
+from typing import Dict, List, NamedTuple, Optional
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+class Scenario(NamedTuple):
+    """
+    Запрос к эндпоинту. В path и строки data подставляются значения
+    контекста ({seq} - номер запроса), save_as - ключ контекста для id
+    из ответа, client - от чьего имени запрос: guest, user или admin.
+    """
+
+    name: str
+    method: str
+    path: str
+    data: Optional[dict] = None
+    save_as: Optional[str] = None
+    client: str = 'user'
+
+
+# Все эндпоинты api/urls.py и users/urls.py. Парные запросы
+# (добавление и удаление) идут подряд и возвращают данные к исходным.
+SCENARIOS = (
+    Scenario('tags list', 'get', '/api/tags/'),
+    Scenario('tag detail', 'get', '/api/tags/{tag}/'),
+    Scenario('ingredients list', 'get', '/api/ingredients/'),
+    Scenario(
+        'ingredients search', 'get', '/api/ingredients/?name={ingredient}'),
+    Scenario('ingredient detail', 'get', '/api/ingredients/{ingredient_id}/'),
+    Scenario('recipes list (guest)', 'get', '/api/recipes/', client='guest'),
+    Scenario('recipes list', 'get', '/api/recipes/'),
+    Scenario('recipes by tag', 'get', '/api/recipes/?tags={tag_slug}'),
+    Scenario('recipes by author', 'get', '/api/recipes/?author={author}'),
+    Scenario('recipes favorited', 'get', '/api/recipes/?is_favorited=1'),
+    Scenario(
+        'recipes in cart', 'get', '/api/recipes/?is_in_shopping_cart=1'),
+    Scenario('recipes search', 'get', '/api/recipes/?search={word}'),
+    Scenario('recipes cursor page', 'get', '/api/recipes/?cursor='),
+    Scenario('recipes feed', 'get', '/api/recipes/feed/'),
+    Scenario('recipe detail', 'get', '/api/recipes/{recipe}/'),
+    Scenario('favorite add', 'post', '/api/recipes/{recipe}/favorite/'),
+    Scenario('favorite remove', 'delete', '/api/recipes/{recipe}/favorite/'),
+    Scenario('cart add', 'post', '/api/recipes/{recipe}/shopping_cart/'),
+    Scenario(
+        'cart remove', 'delete', '/api/recipes/{recipe}/shopping_cart/'),
+    Scenario(
+        'download shopping cart', 'get',
+        '/api/recipes/download_shopping_cart/'),
+    Scenario('recipe create', 'post', '/api/recipes/', {
+        'ingredients': [{'id': '{ingredient_id}', 'amount': 10}],
+        'tags': ['{tag}'],
+        'image': settings.TEST_IMAGE,
+        'name': 'Бенчмарк',
+        'text': 'Рецепт для замера',
+        'cooking_time': 10,
+    }, save_as='created'),
+    Scenario('recipe update', 'patch', '/api/recipes/{created}/', {
+        'ingredients': [{'id': '{ingredient_id}', 'amount': 20}],
+        'tags': ['{tag}'],
+        'name': 'Бенчмарк 2',
+        'text': 'Рецепт для замера',
+        'cooking_time': 20,
+    }),
+    Scenario('recipe delete', 'delete', '/api/recipes/{created}/'),
+    Scenario('user register', 'post', '/api/users/', {
+        'email': 'bench{seq}@example.com',
+        'username': 'bench{seq}',
+        'first_name': 'Бенчмарк',
+        'last_name': 'Бенчмарков',
+        'password': 'Qw7!zLp{seq}x',
+    }, client='guest'),
+    Scenario('users list', 'get', '/api/users/'),
+    Scenario('user detail', 'get', '/api/users/{author}/'),
+    Scenario('users me', 'get', '/api/users/me/'),
+    Scenario('subscriptions', 'get', '/api/users/subscriptions/'),
+    Scenario('subscribe', 'post', '/api/users/{author}/subscribe/'),
+    Scenario('unsubscribe', 'delete', '/api/users/{author}/subscribe/'),
+    Scenario('token login', 'post', '/api/auth/token/login/', {
+        'email': '{login_email}', 'password': '{password}'},
+        save_as='login_token'),
+    Scenario('token logout', 'post', '/api/auth/token/logout/'),
+    Scenario('set password', 'post', '/api/users/set_password/', {
+        'current_password': '{password}', 'new_password': '{password}'}),
+    Scenario(
+        'db pool stats', 'get', '/api/diagnostics/db-pool/', client='admin'),
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Процентиль по методу ближайшего ранга."""
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+
+def fill(value, context: dict):
+    """Подстановка значений контекста в строки данных запроса."""
+    if isinstance(value, dict):
+        return {key: fill(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill(item, context) for item in value]
+    if isinstance(value, str) and value.startswith('{'):
+        return context[value[1:-1]]
+    if isinstance(value, str):
+        return value.format(**context)
+    return value
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency percentiles, queries per request and response '
+        'size of every API endpoint; all changes are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Measured requests per endpoint')
+        parser.add_argument(
+            '--warmup', type=int, default=3,
+            help='Unmeasured requests per endpoint before measuring')
+        parser.add_argument(
+            '--user', help='Email of the user to run requests as '
+                           '(default: the most subscribed generated user)')
+        parser.add_argument(
+            '--password', default='benchmark',
+            help='Password of generated users, used by the login scenario')
+        parser.add_argument(
+            '--only', nargs='*', default=None,
+            help='Run only scenarios whose name contains one of the words')
+        parser.add_argument(
+            '--output', help='Write results to a JSON file')
+        parser.add_argument(
+            '--compare', help='JSON file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['warmup'] < 0:
+            raise CommandError('--requests должен быть больше нуля.')
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['only']
+            or any(word in scenario.name for word in options['only'])
+        ]
+        # Изменения в БД откатываются, загруженные файлы пишутся
+        # во временный каталог и удаляются вместе с ним.
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            MEDIA_ROOT=media_root,
+        ), transaction.atomic():
+            context = self.get_context(options)
+            timings = {scenario.name: [] for scenario in scenarios}
+            for i in range(options['warmup'] + options['requests']):
+                for scenario in scenarios:
+                    result = self.run(scenario, context)
+                    if i >= options['warmup']:
+                        timings[scenario.name].append(result)
+            transaction.set_rollback(True)
+
+        results = {
+            name: self.summarize(samples)
+            for name, samples in timings.items()
+        }
+        report = {
+            'meta': {
+                'requests': options['requests'],
+                'warmup': options['warmup'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+            },
+            'endpoints': results,
+        }
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['endpoints']
+        self.print_report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    def get_context(self, options) -> Dict:
+        """Пользователь и объекты, к которым обращаются сценарии."""
+        users = User.objects.order_by('-followers_count', 'pk')
+        if options['user']:
+            users = users.filter(email=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, сначала выполните generate_data.')
+        author = (
+            User.objects.exclude(pk=user.pk)
+            .exclude(subscribed__user=user)
+            .order_by('-recipes_count').first()
+        )
+        login_user = User.objects.exclude(pk__in=[user.pk, author.pk]).first()
+        recipe = (
+            Recipe.objects.exclude(is_favorited__user=user)
+            .exclude(in_shopping_cart__user=user).first()
+        )
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        if None in (author, login_user, recipe, tag, ingredient):
+            raise CommandError(
+                'Недостаточно данных, сначала выполните generate_data.')
+        admin = User.objects.create(
+            username='benchmark-admin', email='benchmark-admin@example.com',
+            is_staff=True)
+        self.clients = {'guest': APIClient()}
+        for name, client_user in (('user', user), ('admin', admin)):
+            token, _ = Token.objects.get_or_create(user=client_user)
+            self.clients[name] = APIClient()
+            self.clients[name].credentials(
+                HTTP_AUTHORIZATION=f'Token {token.key}')
+        return {
+            'seq': 0,
+            'tag': tag.pk,
+            'tag_slug': tag.slug,
+            'ingredient': ingredient.name[:3],
+            'ingredient_id': ingredient.pk,
+            'author': author.pk,
+            'recipe': recipe.pk,
+            'word': recipe.name.split()[-1],
+            'login_email': login_user.email,
+            'password': options['password'],
+        }
+
+    def run(self, scenario: Scenario, context: dict) -> tuple:
+        """Один запрос: (время в мс, запросов к БД, байт, код ответа)."""
+        client = self.clients[scenario.client]
+        context['seq'] += 1
+        headers = {}
+        if scenario.name == 'token logout':
+            headers['HTTP_AUTHORIZATION'] = (
+                f'Token {context.pop("login_token", "")}')
+            client = APIClient()
+        path = scenario.path.format(**context)
+        data = fill(scenario.data, context)
+        with ExitStack() as stack:
+            # Запросы ко всем алиасам БД, включая реплики.
+            captured = [
+                stack.enter_context(CaptureQueriesContext(alias))
+                for alias in connections.all()
+            ]
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(
+                path, data, format='json', **headers)
+            content = (
+                b''.join(response.streaming_content)
+                if response.streaming else response.content)
+            elapsed = (time.perf_counter() - started) * 1000
+        if scenario.save_as and response.status_code < 300:
+            body = response.json()
+            context[scenario.save_as] = body.get('id', body.get('auth_token'))
+        queries = sum(len(queries) for queries in captured)
+        return elapsed, queries, len(content), response.status_code
+
+    @staticmethod
+    def summarize(samples: List[tuple]) -> Dict:
+        times = [sample[0] for sample in samples]
+        return {
+            'p50_ms': round(percentile(times, 50), 2),
+            'p95_ms': round(percentile(times, 95), 2),
+            'p99_ms': round(percentile(times, 99), 2),
+            'mean_ms': round(mean(times), 2),
+            'queries': max(sample[1] for sample in samples),
+            'bytes': round(mean(sample[2] for sample in samples)),
+            'errors': sum(sample[3] >= 400 for sample in samples),
+            'status': samples[-1][3],
+        }
+
+    def print_report(self, results: Dict, previous: Optional[Dict]) -> None:
+        self.stdout.write(
+            f'{"endpoint":<26}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"queries":>9}{"bytes":>9}{"errors":>8}')
+        for name, result in results.items():
+            line = (
+                f'{name:<26}{result["p50_ms"]:>9}{result["p95_ms"]:>9}'
+                f'{result["p99_ms"]:>9}{result["queries"]:>9}'
+                f'{result["bytes"]:>9}{result["errors"]:>8}')
+            old = (previous or {}).get(name)
+            if old:
+                line += (
+                    f'  p95 {result["p95_ms"] - old["p95_ms"]:+.2f} ms, '
+                    f'queries {result["queries"] - old["queries"]:+d}')
+            style = self.style.ERROR if result['errors'] else str
+            self.stdout.write(style(line))
@@ -0,0 +1,236 @@
+import base64
+import random
+import time
+from importlib import import_module
+from typing import Iterable, Iterator, List, Sequence
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import QuerySet
+
+from core.cache import bump_version
+from core.feed import rebuild_feeds
+from core.shopping_list import rebuild_shopping_lists
+from core.utils import bump_shopping_cart_version
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingCart,
+    Subscribe, Tag)
+from users.models import User
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F2C12E', 'dessert'),
+    ('Выпечка', '#C2703D', 'bakery'),
+    ('Суп', '#D94F4F', 'soup'),
+    ('Салат', '#6FBF73', 'salad'),
+    ('Напиток', '#4FA3D9', 'drink'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Пётр', 'Ольга', 'Сергей', 'Елена')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Орлов')
+ADJECTIVES = (
+    'Домашний', 'Быстрый', 'Праздничный', 'Лёгкий', 'Пряный', 'Бабушкин')
+WORDS = (
+    'нарезать', 'обжарить', 'добавить', 'смешать', 'запечь', 'посолить',
+    'довести', 'до', 'готовности', 'на', 'среднем', 'огне', 'минут',
+    'подавать', 'горячим', 'с', 'зеленью', 'и', 'соусом', 'тесто',
+)
+IMAGE_NAME = 'generated.png'
+
+read_json = import_module('recipes.management.commands.import').read_json
+
+
+def skewed_sample(
+    rng: random.Random, ids: Sequence[int], count: int
+) -> List[int]:
+    """
+    До count разных элементов ids с перекосом к началу списка:
+    немногие популярные авторы и рецепты получают большую часть
+    подписок, избранного и покупок.
+    """
+    count = min(count, len(ids))
+    chosen = set()
+    for _ in range(count * 4):
+        if len(chosen) == count:
+            break
+        chosen.add(ids[int(len(ids) * rng.random() ** 3)])
+    return list(chosen)
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate reproducible synthetic users, subscriptions, recipes, '
+        'favorites and carts; scale 1 is 100 users and 1000 recipes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=int, default=1,
+            help='Multiplier of 100 users and 1000 recipes')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed, the same seed gives the same data')
+        parser.add_argument(
+            '--prefix', default='gen',
+            help='Prefix of usernames and emails of generated users')
+        parser.add_argument(
+            '--password', default='benchmark',
+            help='Password of all generated users')
+        parser.add_argument(
+            '--ingredients',
+            default=str(settings.BASE_DIR / 'data' / 'ingredients.json'),
+            help='JSON file with ingredients to import first')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of rows inserted per query')
+
+    def handle(self, *args, **options):
+        if options['scale'] < 1 or options['batch_size'] < 1:
+            raise CommandError(
+                '--scale и --batch-size должны быть больше нуля.')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}" уже есть, '
+                f'укажите другой --prefix.')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+
+        ingredient_ids = self.create_ingredients(options['ingredients'])
+        tag_ids = self.create_tags()
+        users = User.objects.filter(username__startswith=prefix)
+        user_ids = self.create_users(
+            users, prefix, 100 * options['scale'], options['password'])
+        recipe_ids = self.create_recipes(
+            users, user_ids, 1000 * options['scale'])
+        self.create_relations(recipe_ids, ingredient_ids, tag_ids, user_ids)
+
+        call_command('recount', stdout=self.stdout)
+        rebuild_feeds(users)
+        rebuild_shopping_lists(users)
+        bump_version('tags')
+        bump_version('ingredients')
+        bump_shopping_cart_version(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {time.monotonic() - started:.1f} с.'))
+
+    def insert(self, model, objects: Iterable, **kwargs) -> None:
+        """Вставка пачками, каждая пачка - в отдельной транзакции."""
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+
+    def create_ingredients(self, path: str) -> List[int]:
+        with open(path, encoding='utf-8') as file:
+            self.insert(Ingredient, (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in read_json(file) if name and unit
+            ), ignore_conflicts=True)
+        return list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_tags(self) -> List[int]:
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_users(
+        self, users: QuerySet, prefix: str, count: int, password: str
+    ) -> List[int]:
+        password = make_password(password)
+        self.insert(User, (
+            User(
+                username=f'{prefix}{i}',
+                email=f'{prefix}{i}@example.com',
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                password=password,
+            )
+            for i in range(count)
+        ))
+        return list(users.order_by('pk').values_list('pk', flat=True))
+
+    def create_recipes(
+        self, users: QuerySet, user_ids: List[int], count: int
+    ) -> List[int]:
+        if not default_storage.exists(IMAGE_NAME):
+            default_storage.save(IMAGE_NAME, ContentFile(
+                base64.b64decode(settings.TEST_IMAGE.split(',')[1])))
+        names = list(
+            Ingredient.objects.order_by('pk').values_list('name', flat=True)
+            [:1000])
+        self.insert(Recipe, (
+            Recipe(
+                name=(f'{self.rng.choice(ADJECTIVES)} '
+                      f'{self.rng.choice(names)}')[:200],
+                text=' '.join(self.rng.choices(WORDS, k=40)),
+                image=IMAGE_NAME,
+                cooking_time=self.rng.randint(5, 180),
+                author_id=skewed_sample(self.rng, user_ids, 1)[0],
+            )
+            for _ in range(count)
+        ))
+        return list(
+            Recipe.objects.filter(author__in=users)
+            .order_by('pk').values_list('pk', flat=True))
+
+    def create_relations(
+        self,
+        recipe_ids: List[int],
+        ingredient_ids: List[int],
+        tag_ids: List[int],
+        user_ids: List[int],
+    ) -> None:
+        rng = self.rng
+        self.insert(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(
+                ingredient_ids, min(rng.randint(3, 12), len(ingredient_ids)))
+        ))
+        self.insert(RecipeTag, (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, min(rng.randint(1, 3),
+                                                  len(tag_ids)))
+        ))
+        self.insert(Subscribe, (
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in skewed_sample(rng, user_ids, rng.randint(0, 20))
+            if author_id != user_id
+        ))
+        self.insert(Favorite, (
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in skewed_sample(
+                rng, recipe_ids, rng.randint(0, 50))
+        ))
+        self.insert(ShoppingCart, (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id in user_ids
+            for recipe_id in skewed_sample(
+                rng, recipe_ids, rng.randint(0, 15))
+        ))
@@ -1,38 +1,151 @@
 import csv
 import json
+import time
+from typing import IO, Iterator, Tuple
 
-from django.core.management.base import BaseCommand
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from core.cache import bump_version
 from recipes.models import Ingredient
 
+MAX_REPORTED = 20
+
+
+def read_csv(file: IO) -> Iterator[Tuple[str, str]]:
+    """Построчное чтение пар (название, единица измерения) из CSV."""
+    for row in csv.reader(file):
+        yield tuple(row[:2]) if len(row) >= 2 else ('', '')
+
+
+def read_json(file: IO, chunk_size: int = 64 * 1024) -> Iterator[Tuple]:
+    """
+    Потоковое чтение JSON-массива объектов
+    {"name": ..., "measurement_unit": ...}: файл читается частями,
+    объекты разбираются по одному без загрузки всего документа.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ',':
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                if not chunk:
+                    raise CommandError(f'Некорректный JSON: {error}')
+                break
+            if isinstance(item, dict):
+                yield item.get('name', ''), item.get('measurement_unit', '')
+            else:
+                yield '', ''
+        if not chunk:
+            raise CommandError('Неожиданный конец JSON-файла.')
+
 
 class Command(BaseCommand):
     help = 'Import data from JSON or CSV file'
 
+    readers = {
+        '.json': read_json,
+        '.csv': read_csv,
+    }
+
     def add_arguments(self, parser):
         parser.add_argument(
             'file_path', type=str, help='Path to the JSON or CSV file')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of rows inserted per query')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Read and validate the file without writing to the DB')
 
     def handle(self, *args, **options):
         file_path = options['file_path']
-        if file_path.endswith('.json'):
-            with open(file_path, 'r') as json_file:
-                data = json.load(json_file)
-                for item in data:
-                    ingredient = Ingredient(
-                        name=item['name'],
-                        measurement_unit=item['measurement_unit']
-                    )
-                    ingredient.save()
-        elif file_path.endswith('.csv'):
-            with open(file_path, 'r') as csv_file:
-                reader = csv.reader(csv_file)
-                for row in reader:
-                    ingredient = Ingredient(
-                        name=row[0],
-                        measurement_unit=row[1]
-                    )
-                    ingredient.save()
-        else:
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        reader = next(
+            (reader for extension, reader in self.readers.items()
+             if file_path.endswith(extension)),
+            None
+        )
+        if reader is None:
             self.stdout.write(self.style.ERROR(
                 'Неверный формат файла. Используйте JSON или CSV файл.'))
+            return
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+
+        started = time.monotonic()
+        count_before = Ingredient.objects.count()
+        rows = skipped = 0
+        batch = []
+        # Весь файл - одна транзакция: ошибка БД на любой пачке
+        # отменяет уже вставленные.
+        with open(file_path, 'r', encoding='utf-8') as file, \
+                transaction.atomic():
+            for name, measurement_unit in reader(file):
+                rows += 1
+                ingredient = Ingredient(
+                    name=str(name).strip(),
+                    measurement_unit=str(measurement_unit).strip())
+                try:
+                    ingredient.clean_fields()
+                except ValidationError as error:
+                    skipped += 1
+                    self.report_row(rows, error, skipped)
+                    continue
+                batch.append(ingredient)
+                if len(batch) >= batch_size:
+                    self.save_batch(batch, dry_run)
+                    batch = []
+            self.save_batch(batch, dry_run)
+
+        created = Ingredient.objects.count() - count_before
+        if created:
+            bump_version('ingredients')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Проверено" if dry_run else "Обработано"} строк: {rows}, '
+            f'добавлено: {created}, пропущено некорректных: {skipped}. '
+            f'{elapsed:.2f} с, {rows / elapsed if elapsed else 0:.0f} '
+            f'строк/с.'
+        ))
+
+    def report_row(self, row: int, error: ValidationError, skipped: int):
+        """Вывод причин пропуска первых MAX_REPORTED строк."""
+        if skipped > MAX_REPORTED:
+            return
+        messages = '; '.join(
+            f'{field}: {" ".join(errors)}'
+            for field, errors in error.message_dict.items())
+        self.stdout.write(self.style.WARNING(f'Строка {row}: {messages}'))
+
+    @staticmethod
+    def save_batch(batch: list, dry_run: bool) -> None:
+        """
+        Вставка пачки одним запросом.
+        Уже существующие пары (название, единица) пропускаются.
+        """
+        if not batch or dry_run:
+            return
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
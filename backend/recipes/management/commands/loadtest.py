@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+from typing import Dict, List, Optional
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.management.commands.benchmark import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?tags=breakfast',
+    '/api/tags/',
+    '/api/ingredients/?name=са',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure throughput of a running server (gunicorn WSGI or ASGI '
+        'mode) under concurrent clients')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Base URL of the server')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, may be repeated '
+                 '(default: recipes, tags and ingredients lists)')
+        parser.add_argument(
+            '--token', help='Auth token, required for the shopping cart')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 8, 32],
+            help='Numbers of concurrent clients to test')
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Seconds per concurrency level')
+        parser.add_argument(
+            '--label', default='', help='Name of the setup in the report')
+        parser.add_argument(
+            '--output', help='Write results to a JSON file')
+        parser.add_argument(
+            '--compare', help='JSON file of a previous run to compare with')
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1 or options['duration'] <= 0:
+            raise CommandError(
+                '--concurrency и --duration должны быть больше нуля.')
+        headers = {}
+        if options['token']:
+            headers['Authorization'] = f'Token {options["token"]}'
+        urls = [
+            options['url'].rstrip('/') + path
+            for path in options['paths'] or DEFAULT_PATHS
+        ]
+        results = {
+            str(concurrency): self.run_level(
+                urls, headers, concurrency, options['duration'])
+            for concurrency in options['concurrency']
+        }
+        previous = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                previous = json.load(file)['levels']
+        self.print_report(results, previous)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump({
+                    'label': options['label'],
+                    'url': options['url'],
+                    'paths': options['paths'] or DEFAULT_PATHS,
+                    'duration': options['duration'],
+                    'levels': results,
+                }, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def run_level(
+        urls: List[str], headers: dict, concurrency: int, duration: float
+    ) -> Dict:
+        """Клиенты в потоках запрашивают urls по кругу duration секунд."""
+        samples = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def client(offset: int):
+            local = []
+            offset %= len(urls)
+            with requests.Session() as session:
+                session.headers.update(headers)
+                for url in cycle(urls[offset:] + urls[:offset]):
+                    if time.monotonic() >= deadline:
+                        break
+                    started = time.perf_counter()
+                    try:
+                        response = session.get(url, timeout=30)
+                        status, size = (
+                            response.status_code, len(response.content))
+                    except requests.RequestException:
+                        status, size = 0, 0
+                    local.append(
+                        ((time.perf_counter() - started) * 1000, status, size))
+            with lock:
+                samples.extend(local)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for worker in range(concurrency):
+                pool.submit(client, worker)
+        elapsed = time.monotonic() - started
+        times = [sample[0] for sample in samples] or [0.0]
+        return {
+            'requests': len(samples),
+            'rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(times, 50), 2),
+            'p95_ms': round(percentile(times, 95), 2),
+            'p99_ms': round(percentile(times, 99), 2),
+            'errors': sum(not 200 <= status < 400 for _, status, _ in samples),
+            'bytes': sum(size for *_, size in samples),
+        }
+
+    def print_report(self, results: Dict, previous: Optional[Dict]) -> None:
+        self.stdout.write(
+            f'{"clients":>8}{"req/s":>10}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"errors":>8}')
+        for concurrency, result in results.items():
+            line = (
+                f'{concurrency:>8}{result["rps"]:>10}{result["p50_ms"]:>9}'
+                f'{result["p95_ms"]:>9}{result["p99_ms"]:>9}'
+                f'{result["errors"]:>8}')
+            old = (previous or {}).get(concurrency)
+            if old:
+                line += (
+                    f'  req/s {result["rps"] - old["rps"]:+.1f}, '
+                    f'p95 {result["p95_ms"] - old["p95_ms"]:+.2f} ms')
+            style = self.style.ERROR if result['errors'] else str
+            self.stdout.write(style(line))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.shopping_list import expected_items, rebuild_shopping_lists
+from core.utils import bump_shopping_cart_version
+from recipes.models import ShoppingListItem
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Recompute shopping list totals from the shopping carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the number of users with wrong totals')
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        expected = set(expected_items(users).iterator())
+        actual = set(ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total').iterator())
+        wrong = {user_id for user_id, *_ in expected ^ actual}
+        if wrong and not options['dry_run']:
+            users = User.objects.filter(pk__in=wrong)
+            with transaction.atomic():
+                rebuild_shopping_lists(users)
+                bump_shopping_cart_version(users)
+        self.stdout.write(
+            f'Списки покупок: пользователей с неверными итогами {len(wrong)}')
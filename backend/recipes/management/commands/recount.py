@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from core.counters import COUNTERS, count_subquery
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized favorites/cart/recipes/followers counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the number of wrong counters')
+
+    def handle(self, *args, **options):
+        for model, field, counted_model, counted_field in COUNTERS:
+            actual = count_subquery(counted_model, counted_field)
+            with transaction.atomic():
+                wrong = (
+                    model.objects
+                    .annotate(actual=actual)
+                    .exclude(**{field: F('actual')})
+                    .count()
+                )
+                if wrong and not options['dry_run']:
+                    model.objects.update(**{field: actual})
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'неверных значений {wrong}'
+            )
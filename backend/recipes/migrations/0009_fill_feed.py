@@ -0,0 +1,43 @@
+from itertools import islice
+
+from django.db import migrations
+
+FEED_BACKFILL_LIMIT = 100
+BATCH_SIZE = 1000
+
+
+def fill_feed(apps, schema_editor):
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('recipes', 'Subscribe')
+    subscriptions = Subscribe.objects.values_list('user_id', 'author_id')
+    recipes = {}
+    for author_id, recipe_id in (
+        Recipe.objects
+        .filter(author__in=subscriptions.values('author_id'))
+        .order_by('-id').values_list('author_id', 'pk').iterator()
+    ):
+        recipes.setdefault(author_id, [])
+        if len(recipes[author_id]) < FEED_BACKFILL_LIMIT:
+            recipes[author_id].append(recipe_id)
+    entries = (
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        for user_id, author_id in subscriptions.order_by().iterator()
+        for recipe_id in recipes.get(author_id, ())
+    )
+    while True:
+        batch = list(islice(entries, BATCH_SIZE))
+        if not batch:
+            return
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
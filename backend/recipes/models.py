@@ -1,8 +1,11 @@
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
+from core.models import ProtectedFieldsMixin
+
 
 User = get_user_model()
 
@@ -41,11 +44,15 @@ class Ingredient(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class Recipe(ProtectedFieldsMixin, models.Model):
     name = models.CharField('Название', max_length=200, blank=False)
     text = models.TextField('Описание', blank=False)
     image = models.ImageField(
         'Изображение', null=True)
+    image_thumbnail = models.ImageField(
+        'Миниатюра', null=True, blank=True, editable=False)
+    image_webp = models.ImageField(
+        'Миниатюра WebP', null=True, blank=True, editable=False)
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         validators=[
@@ -62,11 +69,23 @@ class Recipe(models.Model):
         Tag, through='RecipeTag', verbose_name='Теги к рецепту')
     ingredients = models.ManyToManyField(
         Ingredient, through='RecipeIngredient', verbose_name='Ингредиенты')
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    cart_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False)
+
+    protected_fields = ('favorites_count', 'cart_count', 'search_vector')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name[:settings.LEN_LIMIT]
@@ -88,6 +107,10 @@ class RecipeTag(models.Model):
         verbose_name = 'Тег рецепта'
         verbose_name_plural = 'Теги рецептов'
         ordering = ('-id',)
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'], name='recipe_tag_tag_recipe_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name='unique_recipe_tag',
@@ -216,3 +239,79 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return (f'{self.recipe} в корзине у {self.user}')
+
+
+class FeedEntry(models.Model):
+    """
+    Запись ленты подписчика: рецепт автора, на которого он подписан.
+    Заполняется при публикации рецепта и при подписке.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='in_feeds',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'],
+            name='unique_feed_entry'
+        )]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('-recipe',)
+
+    def __str__(self) -> str:
+        return f'{self.recipe} в ленте у {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итог списка покупок пользователя по ингредиенту: сумма количеств
+    во всех рецептах его корзины. Поддерживается при изменении
+    корзины и ингредиентов рецептов (core/shopping_list.py).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    total = models.IntegerField('Количество')
+
+    class Meta:
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'ingredient'],
+            name='unique_shopping_list_item'
+        )]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        ordering = ('user', 'ingredient')
+
+    def __str__(self) -> str:
+        return f'{self.ingredient}: {self.total} у {self.user}'
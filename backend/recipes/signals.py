@@ -0,0 +1,119 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from core import feed
+from core.cache import bump_version
+from core.counters import change_counter
+from core.shopping_list import change_recipe_in_list
+from core.utils import bump_shopping_cart_version, invalidate_recipe_fragments
+from users.models import User
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+    Subscribe,
+    Tag,
+)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    bump_version('ingredients')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version('tags')
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        bump_shopping_cart_version(User.objects.filter(pk=instance.user_id))
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id), 'cart_count', 1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_list_added(sender, instance, created, **kwargs):
+    if created:
+        change_recipe_in_list(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_list_deleted(sender, instance, **kwargs):
+    # До удаления: при каскадном удалении рецепта его ингредиенты
+    # удаляются в той же операции.
+    change_recipe_in_list(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(sender, instance, **kwargs):
+    bump_shopping_cart_version(User.objects.filter(pk=instance.user_id))
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'cart_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_counter(
+        Recipe.objects.filter(pk=instance.recipe_id), 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscribe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'followers_count', 1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscribe_deleted(sender, instance, **kwargs):
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'followers_count', -1)
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+    if created:
+        change_counter(
+            User.objects.filter(pk=instance.author_id), 'recipes_count', 1)
+        feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+    change_counter(
+        User.objects.filter(pk=instance.author_id), 'recipes_count', -1)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+def recipe_relation_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    invalidate_recipe_fragments(
+        instance.recipes.values_list('pk', flat=True))
@@ -8,5 +8,4 @@ class UserAdmin(admin.ModelAdmin):
     list_display = (
         'pk', 'username', 'email', 'first_name', 'last_name')
     search_fields = ('username', 'first_name', 'last_name', 'email')
-    list_filter = ('username', 'email')
     empty_value_display = '-пусто-'
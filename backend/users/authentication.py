@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+# Пароль и поддерживаемые в БД счётчики и версии не кэшируются:
+# у восстановленного пользователя они отложены и читаются из БД
+# при обращении, а сохранение пользователя их не перезаписывает.
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.name not in ('password', *User.protected_fields)
+)
+TOKEN_FIELDS = tuple(field.attname for field in Token._meta.concrete_fields)
+
+
+def token_cache_key(key: str) -> str:
+    return f'auth-token:{key}'
+
+
+def user_token_cache_key(user_id: int) -> str:
+    return f'auth-token-user:{user_id}'
+
+
+def invalidate_token(key: str) -> None:
+    cache.delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user_id: int) -> None:
+    """Сбрасывает закешированный токен пользователя."""
+    key = cache.get(user_token_cache_key(user_id))
+    if key is not None:
+        cache.delete_many(
+            [token_cache_key(key), user_token_cache_key(user_id)])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без обращения к БД на каждый запрос.
+    Значения полей токена и полей пользователя USER_FIELDS
+    хранятся в кеше AUTH_TOKEN_CACHE_TIMEOUT секунд; запись
+    сбрасывается при выходе (удалении токена) и при сохранении
+    пользователя - смене пароля, деактивации и т.п. Сброс виден
+    другим процессам только при общем кеше.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = cache.get(token_cache_key(key))
+        if snapshot is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set_many({
+                token_cache_key(key): (
+                    tuple(getattr(token, name) for name in TOKEN_FIELDS),
+                    tuple(getattr(user, name) for name in USER_FIELDS),
+                ),
+                user_token_cache_key(user.pk): key,
+            }, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+            return user, token
+        token_values, user_values = snapshot
+        user = User.from_db(None, USER_FIELDS, user_values)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.')
+        token = Token.from_db(None, TOKEN_FIELDS, token_values)
+        token.user = user
+        return user, token
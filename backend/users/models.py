@@ -3,9 +3,10 @@ from django.contrib.auth.validators import UnicodeUsernameValidator
 from django.db import models
 
 from api.validators import FirstNameValidator, LastNameValidator
+from core.models import ProtectedFieldsMixin
 
 
-class User(AbstractUser):
+class User(ProtectedFieldsMixin, AbstractUser):
     username = models.CharField(
         verbose_name='Имя пользователя',
         max_length=150,
@@ -37,6 +38,23 @@ class User(AbstractUser):
         blank=False,
         validators=[LastNameValidator()]
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+        editable=False,
+    )
+    shopping_cart_version = models.PositiveIntegerField(
+        verbose_name='Версия корзины',
+        default=0,
+        editable=False,
+    )
+    protected_fields = (
+        'recipes_count', 'followers_count', 'shopping_cart_version')
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
 
@@ -2,6 +2,8 @@ from django.contrib.auth import get_user_model
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
+from core.relations import related_ids
+
 User = get_user_model()
 
 
@@ -25,11 +27,10 @@ class UserCustomSerializer(UserSerializer):
     def get_is_subscribed(self, obj: User) -> bool:
         """Поле проверки подписки на пользователя/автора."""
 
-        if self.context.get('request'):
-            user = self.context.get('request').user
-            if not (user.is_anonymous or (user == obj)):
-                return user.subscriber.filter(author=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return obj.pk in related_ids(
+            self.context.get('request'), 'subscriptions')
 
 
 class UserRegistrySerializer(UserCreateSerializer):